@@ -18,6 +18,13 @@ from itertools import chain, islice, izip, repeat
 from random import randint, shuffle
 import collections
 import tempfile
+import threading
+import multiprocessing
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 # Make the same code base run with Python 2 and 3.
@@ -35,7 +42,11 @@ from py.test import raises, mark
 sys.path.insert(0, os.path.abspath('..'))
 from timegaps.timegaps import FileSystemEntry, TimegapsError, FilterItem
 from timegaps.timefilter import TimeFilter, _Timedelta, TimeFilterError
+import timegaps.timefilter as timefilter
 import timegaps.timediff as timediff
+import timegaps.localtime as localtime
+import timegaps.fileops as fileops
+from timegaps.timeparse import TimeParser
 
 import logging
 logging.basicConfig(
@@ -46,6 +57,9 @@ log.setLevel(logging.DEBUG)
 
 
 WINDOWS = sys.platform == "win32"
+# TimeFilter.filter(workers=N) forks worker processes (Python 3.7+, POSIX).
+FORK = timefilter._MP_CONTEXT and (
+    "fork" in multiprocessing.get_all_start_methods())
 SHORTTIME = 0.01
 
 
@@ -121,6 +135,67 @@ def make_dense_fses(ref):
     return fses
 
 
+def make_dense_fses_with_duplicates(ref):
+    """Like `make_dense_fses()`, plus items sharing their modification time
+    with existing items.
+    """
+    fses = make_dense_fses(ref)
+    fses += [FilterItem(moddate=f.moddate) for f in fses[:300]]
+    return fses
+
+
+def random_rules():
+    """Return random rules for all categories, with at least one year."""
+    rules = {c: randint(0, 16) for c in TimeFilter.valid_categories}
+    rules["years"] += 1
+    return rules
+
+
+# Reference time and dense items shared by the tests of the alternative
+# filter engines. Tests must not modify the list.
+DENSE_NOW = datetime(2016, 12, 31, 23, 59, 59)
+DENSE_FSES = make_dense_fses_with_duplicates(ref=DENSE_NOW)
+
+
+def filter_presorted(f, fses):
+    return f.filter(sorted(fses, key=lambda o: o.moddate), presorted=True)
+
+
+def filter_stream(f, fses):
+    results = list(f.filter_stream(iter(fses)))
+    assert len(results) == len(fses)
+    return ([o for o, accepted in results if accepted],
+            [o for o, accepted in results if not accepted])
+
+
+def filter_reftimes(f, fses):
+    # Evaluate a reference time later than the one of `f` in the same pass,
+    # to be sure that the result for the first one is not affected.
+    reftimes = [f.reftime, f.reftime + timedelta(days=3)]
+    return f.filter_reftimes(fses, reftimes)[0]
+
+
+def filter_workers(f, fses):
+    return f.filter(fses, workers=3)
+
+
+def filter_array(f, fses):
+    moddates = numpy.array([o.moddate for o in fses], dtype="datetime64[us]")
+    ai, ri = f.filter_array(moddates)
+    return [fses[i] for i in ai], [fses[i] for i in ri]
+
+
+# Alternative filter engines: (TimeFilter, items) -> (accepted, rejected).
+FILTER_ENGINES = {
+    "presorted": filter_presorted,
+    "stream": filter_stream,
+    "reftimes": filter_reftimes,
+    "workers": filter_workers,
+    }
+if numpy is not None:
+    FILTER_ENGINES["array"] = filter_array
+
+
 class TestMakeModdates(object):
     """Self-test for the make_moddates helper function"""
 
@@ -182,12 +257,39 @@ class TestBasicFSEntry(object):
             assert fse.type == "file"
             assert isinstance(fse.moddate, datetime)
 
+    def test_moddate_from_stat(self):
+        with tempfile.NamedTemporaryFile() as t:
+            os.utime(t.name, (0, 1234567890.123456))
+            fse = FileSystemEntry(path=t.name)
+            assert fse.moddate == datetime.fromtimestamp(os.lstat(t.name).st_mtime)
+            # Created upon first access, not changed upon subsequent access.
+            assert fse.moddate is fse.moddate
+
+    def test_statobj(self):
+        with tempfile.NamedTemporaryFile() as t:
+            statobj = os.lstat(t.name)
+            os.remove(t.name)
+            # The file system is not accessed.
+            fse = FileSystemEntry(path=t.name, statobj=statobj)
+            assert fse.type == "file"
+            assert fse.moddate == datetime.fromtimestamp(statobj.st_mtime)
+            open(t.name, "w").close()
+
     def test_custom_moddate(self):
         with tempfile.NamedTemporaryFile() as t:
             fse = FileSystemEntry(path=t.name, moddate=datetime(1977, 7, 7))
             assert fse.type == "file"
             assert isinstance(fse.moddate, datetime)
 
+    def test_set_moddate(self):
+        with tempfile.NamedTemporaryFile() as t:
+            fse = FileSystemEntry(path=t.name)
+            fse.moddate = datetime(2000, 1, 1)
+            assert fse.modseconds == localtime.seconds(datetime(2000, 1, 1))
+            f = TimeFilter(rules={"years": 1}, reftime=datetime(2001, 6, 1))
+            a, r = f.filter([fse])
+            assert a == [fse]
+
     def test_custom_moddate_wrongtype(self):
         with tempfile.NamedTemporaryFile() as t:
             with raises(TimegapsError):
@@ -321,6 +423,30 @@ class TestTimedelta(object):
         assert isinstance(d.hours, int)
 
 
+class TestTimediffIndices(object):
+    """Test that the integer arithmetic in timediff.indices()/diffs() yields
+    the same results as the datetime based timediff functions.
+    """
+    def test_random_dates(self):
+        ref = datetime(2016, 2, 29, 0, 30)
+        refindices = timediff.indices(ref)
+        for seconds in nrndint(10000, 0, 10**10):
+            t = ref - timedelta(seconds=seconds)
+            assert timediff.diffs(t, refindices) == (
+                timediff.hours(t, ref),
+                timediff.days(t, ref),
+                timediff.weeks(t, ref),
+                timediff.months(t, ref),
+                timediff.years(t, ref))
+
+    def test_week_starts_on_monday(self):
+        # 2016-01-04 is a Monday.
+        refindices = timediff.indices(datetime(2016, 1, 4))
+        assert timediff.diffs(datetime(2016, 1, 3, 23), refindices)[2] == 1
+        assert timediff.diffs(datetime(2015, 12, 28), refindices)[2] == 1
+        assert timediff.diffs(datetime(2015, 12, 27), refindices)[2] == 2
+
+
 class TestTimeFilterBasic(object):
     """Test TimeFilter logic and arithmetics with small, well-defined mock
     object lists.
@@ -704,3 +830,607 @@ class TestTimeFilterPeriodic(object):
             a, _ = TimeFilter(rules, current).filter(items)
             assert len(a) == len(items)
             current = current + timedelta(minutes=1)
+
+
+class TestTimeFilterEngines(object):
+    """Test the alternative filter engines against TimeFilter.filter().
+    """
+    @mark.parametrize("engine", sorted(FILTER_ENGINES))
+    def test_same_result_as_filter(self, engine):
+        reftimes = [DENSE_NOW + timedelta(minutes=m)
+                    for m in chain([0, 7, 60 * 25], nrndint(2, 0, 10**6))]
+        for reftime in reftimes:
+            for _ in range(4):
+                f = TimeFilter(random_rules(), reftime)
+                a, r = f.filter(DENSE_FSES)
+                ea, er = FILTER_ENGINES[engine](f, DENSE_FSES)
+                assert set(ea) == set(a)
+                assert [o.moddate for o in ea] == [o.moddate for o in a]
+                assert set(er) == set(r)
+                assert len(er) == len(r)
+
+    @mark.parametrize("engine", sorted(FILTER_ENGINES))
+    def test_future(self, engine):
+        fses = DENSE_FSES + [
+            FilterItem(moddate=DENSE_NOW + timedelta(seconds=1))]
+        f = TimeFilter({"days": 1}, DENSE_NOW)
+        with raises(TimeFilterError):
+            FILTER_ENGINES[engine](f, fses)
+
+
+class TestTimeFilterPresorted(object):
+    """Test TimeFilter.filter(presorted=True).
+    """
+    fses = sorted(DENSE_FSES, key=lambda f: f.moddate)
+
+    def test_exact_rejected_order(self):
+        f = TimeFilter(random_rules(), DENSE_NOW)
+        assert f.filter(self.fses, presorted=True)[1] == f.filter(self.fses)[1]
+
+    def test_recent_only(self):
+        fses = [f for f in self.fses
+                if f.moddate > DENSE_NOW - timedelta(hours=1)]
+        a, r = TimeFilter({"recent": 3}, DENSE_NOW).filter(
+            fses, presorted=True)
+        assert a == fses[-3:]
+        assert r == fses[:-3]
+
+    def test_unsorted(self):
+        f = TimeFilter({"days": 5, "recent": 5}, DENSE_NOW)
+        # The newest two items may have the same modification time.
+        newest = [FilterItem(moddate=DENSE_NOW - timedelta(seconds=s))
+            for s in (1, 0)]
+        for fses in (self.fses[::-1], newest[::-1]):
+            with raises(TimeFilterError):
+                f.filter(fses, presorted=True)
+
+
+class TestTimeFilterReftimes(object):
+    """Test TimeFilter.filter_reftimes().
+    """
+    def test_many_reftimes(self):
+        reftimes = [DENSE_NOW + timedelta(minutes=m)
+                    for m in chain(range(0, 180, 7), nrndint(20, 0, 10**6))]
+        rules = random_rules()
+        f = TimeFilter(rules, DENSE_NOW)
+        results = f.filter_reftimes(DENSE_FSES, reftimes)
+        assert len(results) == len(reftimes)
+        for reftime, (a, r) in zip(reftimes, results):
+            ea, er = TimeFilter(rules, reftime).filter(DENSE_FSES)
+            assert set(a) == set(ea)
+            assert r == er
+
+    def test_reftime_earlier_than_filter_reftime(self):
+        f = TimeFilter({"days": 1}, DENSE_NOW)
+        with raises(TimeFilterError):
+            f.filter_reftimes(DENSE_FSES, [DENSE_NOW - timedelta(days=1)])
+
+    def test_period_starts_clamped(self):
+        assert timediff.period_starts("years", datetime(3, 5, 5), 10) == [
+            datetime(3, 1, 1), datetime(2, 1, 1), datetime(1, 1, 1)]
+        assert len(timediff.period_starts("hours", datetime(1, 1, 2), 99)) == 25
+
+
+class TestTimeFilterStream(object):
+    """Test TimeFilter.filter_stream().
+    """
+    now = DENSE_NOW
+
+    def test_rejected_early(self):
+        # Newer items displace older items from the same hour bucket: each
+        # displaced item is yielded before the next input item is consumed.
+        items = [FilterItem(moddate=self.now - timedelta(hours=1, minutes=m))
+                 for m in range(50, 0, -10)]
+        consumed = []
+
+        def gen():
+            for item in items:
+                consumed.append(item)
+                yield item
+
+        stream = TimeFilter({"hours": 1}, self.now).filter_stream(gen())
+        for n, (obj, accepted) in enumerate(islice(stream, len(items) - 1)):
+            assert not accepted
+            assert obj is items[n]
+            assert len(consumed) == n + 2
+        assert list(stream) == [(items[-1], True)]
+
+
+class TestTimeFilterBucketCache(object):
+    """Test the per-hour and per-day bucket lookup cache of TimeFilter.filter()
+    around the oldest hour bucket, where the cache key changes from hour to day.
+    """
+    now = datetime(2016, 12, 31, 23, 59, 59)
+
+    def test_same_result_as_filter_stream(self):
+        fses = [FilterItem(moddate=self.now - timedelta(minutes=10 * i))
+            for i in range(1000)]
+        for hours in (1, 5, 30, 50):
+            f = TimeFilter({"hours": hours, "days": 3, "weeks": 1}, self.now)
+            a, r = f.filter(fses)
+            results = list(f.filter_stream(iter(fses)))
+            assert set(a) == set(o for o, accepted in results if accepted)
+
+
+class TestLocalTime(object):
+    """Test conversion of Unix timestamps to local seconds and datetime objects
+    against `datetime.fromtimestamp()`.
+    """
+    def test_same_as_fromtimestamp(self):
+        for _ in range(10000):
+            t = randint(-10**9, 2 * 10**9) + randint(0, 10**6) / 10.0**6
+            s = localtime.local_seconds(t)
+            assert localtime.local_datetime(s) == datetime.fromtimestamp(t)
+            assert abs(localtime.seconds(datetime.fromtimestamp(t)) - s) < 1e-6
+
+    @mark.skipif("not hasattr(time, 'tzset')")
+    def test_dst_transitions(self):
+        tz = os.environ.get("TZ")
+        os.environ["TZ"] = "Europe/Berlin"
+        time.tzset()
+        try:
+            offsets = localtime.UTCOffsets()
+            # Sample the table around these timestamps.
+            offsets.past = 50 * 365 * 86400
+            # Switch to and from daylight saving time in 2014.
+            for transition, before, after in ((1396141200, 3600, 7200),
+                                              (1414285200, 7200, 3600)):
+                for t in range(transition - 3, transition):
+                    assert offsets.offset(t) == before
+                for t in range(transition, transition + 3):
+                    assert offsets.offset(t) == after
+            assert offsets.offset(1000000000) == 7200
+        finally:
+            if tz is None:
+                del os.environ["TZ"]
+            else:
+                os.environ["TZ"] = tz
+            time.tzset()
+
+    def test_outlier(self):
+        offsets = localtime.UTCOffsets()
+        now = int(time.time())
+        offsets.offset(now)
+        # A file dated 2446 does not extend the table up to it.
+        t = 15000000000
+        assert offsets.offset(t) == localtime._utcoffset(t)
+        assert offsets._hi < now + 2 * offsets.future
+        # Neither does a timestamp close to (or before) the epoch.
+        assert offsets.offset(0) == localtime._utcoffset(0)
+        assert not offsets._extensible(-1)
+        assert offsets._lo > 0
+
+    def test_filter_fses_same_as_filteritems(self):
+        now = datetime.now().replace(microsecond=0)
+        fses = []
+        with tempfile.NamedTemporaryFile() as t:
+            for _ in range(1000):
+                mtime = time.time() - randint(0, 10**8)
+                os.utime(t.name, (mtime, mtime))
+                fses.append(FileSystemEntry(path=t.name))
+        items = [FilterItem(moddate=localtime.local_datetime(f.modseconds))
+            for f in fses]
+        f = TimeFilter({"recent": 3, "hours": 30, "days": 20, "weeks": 10,
+            "months": 12, "years": 3}, now)
+        a, r = f.filter(fses)
+        ia, ir = f.filter(items)
+        assert [fses.index(x) for x in a] == [items.index(x) for x in ia]
+
+
+class TestTimeParser(object):
+    """Test `TimeParser` against `datetime.strptime()`: same results, same
+    errors.
+    """
+    def check(self, fmt, strings):
+        p = TimeParser(fmt)
+        for s in strings:
+            try:
+                expected = datetime.strptime(s, fmt)
+            except ValueError as e:
+                with raises(ValueError) as exc:
+                    p.parse(s)
+                assert str(exc.value) == str(e)
+            else:
+                assert p.parse(s) == expected
+
+    def test_compiled(self):
+        fmt = "%Y%m%d-%H%M%S"
+        assert TimeParser(fmt)._regex is not None
+        self.check(fmt, ["20140101-000000", "20161231-235959", "2014111-1234",
+            "20140230-000000", "20140101-240000", "20140101-000060",
+            "20140101_000000", "20140101-0000001", "x20140101-000000", ""])
+
+    def test_random(self):
+        fmts = ["%Y%m%d-%H%M%S", "%Y-%m-%d %H:%M:%S.%f", "snap.%d%m%y",
+            "%H%M", "(%Y)%%[%m]"]
+        for fmt in fmts:
+            strings = []
+            for _ in range(500):
+                d = datetime(randint(1900, 2100), randint(1, 12),
+                    randint(1, 28), randint(0, 23), randint(0, 59),
+                    randint(0, 59), randint(0, 999999))
+                s = d.strftime(fmt)
+                i = randint(0, len(s) - 1)
+                strings.extend([s, s[:i] + s[i + 1:], s[:i] + "1" + s[i:]])
+            self.check(fmt, strings)
+
+    def test_strptime_fallback(self):
+        for fmt in ("%b %d %Y", "%Y%j", "%Y%Y", "%Y%"):
+            assert TimeParser(fmt)._regex is None
+        self.check("%b %d %Y", ["Jan 01 2014", "Feb 30 2014", "01 01 2014"])
+        self.check("%Y%", ["2014", "2014%"])
+
+
+class TestRemoveTree(object):
+    """Test `fileops.remove_tree()` (recursive deletion for -d -r).
+    """
+    def setup_method(self, method):
+        self.tmpdir = tempfile.mkdtemp()
+        self.outside = os.path.join(self.tmpdir, "outside")
+        os.mkdir(self.outside)
+        open(os.path.join(self.outside, "keep"), "w").close()
+
+    def teardown_method(self, method):
+        import shutil
+        shutil.rmtree(self.tmpdir)
+
+    def mktree(self, width=3, depth=3):
+        """Create tree with `width` files and subdirectories per directory,
+        containing a symbolic link to a directory outside of the tree. Return
+        tree path and the number of entries.
+        """
+        top = os.path.join(self.tmpdir, "tree")
+        count = 0
+        dirs = [top]
+        os.mkdir(top)
+        for level in range(depth):
+            subdirs = []
+            for d in dirs:
+                for i in range(width):
+                    open(os.path.join(d, "f%s" % i), "w").close()
+                    if level < depth - 1:
+                        subdirs.append(os.path.join(d, "d%s" % i))
+                        os.mkdir(subdirs[-1])
+                count += width
+            count += len(subdirs)
+            deepest, dirs = dirs[-1], subdirs
+        if hasattr(os, "symlink"):
+            os.symlink(self.outside, os.path.join(deepest, "link"))
+            count += 1
+        return top, count + 1
+
+    def check(self, workers):
+        top, count = self.mktree()
+        assert fileops.remove_tree(top, workers) == count
+        assert not os.path.exists(top)
+        assert os.path.exists(os.path.join(self.outside, "keep"))
+
+    def test_serial(self):
+        self.check(workers=1)
+
+    def test_parallel(self):
+        self.check(workers=2)
+
+    def test_parallel_wide(self):
+        top, count = self.mktree(width=20, depth=2)
+        assert fileops.remove_tree(top, 4) == count
+
+    def test_by_path(self):
+        fd_based, fileops.FD_BASED = fileops.FD_BASED, False
+        try:
+            self.check(workers=1)
+        finally:
+            fileops.FD_BASED = fd_based
+
+    @mark.skipif("not hasattr(os, 'symlink')")
+    def test_symlink(self):
+        link = os.path.join(self.tmpdir, "link")
+        os.symlink(self.outside, link)
+        with raises(OSError):
+            fileops.remove_tree(link)
+        assert os.path.exists(os.path.join(self.outside, "keep"))
+
+    def test_not_a_dir(self):
+        with raises(OSError):
+            fileops.remove_tree(os.path.join(self.outside, "keep"))
+
+    def test_nonexistent(self):
+        with raises(OSError):
+            fileops.remove_tree(os.path.join(self.tmpdir, "nonexistent"), 2)
+
+
+class TestMove(object):
+    """Test `fileops.move()`, including cross-device moves (simulated by
+    letting `os.rename()` fail with EXDEV).
+    """
+    def setup_method(self, method):
+        self.tmpdir = tempfile.mkdtemp()
+        self.tdir = os.path.join(self.tmpdir, "target")
+        os.mkdir(self.tdir)
+        self.rename = os.rename
+
+    def teardown_method(self, method):
+        import shutil
+        os.rename = self.rename
+        fileops._unsupported.clear()
+        shutil.rmtree(self.tmpdir)
+
+    def exdev(self):
+        import errno
+
+        def rename(src, dst):
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+        os.rename = rename
+
+    def mfile(self, path, data=b"data", mtime=1000000000):
+        with open(path, "wb") as f:
+            f.write(data)
+        os.utime(path, (mtime, mtime))
+
+    def check_file(self, path, data=b"data", mtime=1000000000):
+        with open(path, "rb") as f:
+            assert f.read() == data
+        assert os.lstat(path).st_mtime == mtime
+
+    def test_rename(self):
+        src = os.path.join(self.tmpdir, "f")
+        self.mfile(src)
+        dst = fileops.move(src, self.tdir)
+        assert dst == os.path.join(self.tdir, "f")
+        assert not os.path.exists(src)
+        self.check_file(dst)
+
+    def test_exists(self):
+        src = os.path.join(self.tmpdir, "f")
+        self.mfile(src)
+        self.mfile(os.path.join(self.tdir, "f"), b"other")
+        with raises(OSError):
+            fileops.move(src, self.tdir)
+        self.check_file(src)
+        self.check_file(os.path.join(self.tdir, "f"), b"other")
+
+    def test_exdev_file(self):
+        self.exdev()
+        src = os.path.join(self.tmpdir, "f")
+        data = os.urandom(3 * 10**6)
+        self.mfile(src, data)
+        os.chmod(src, 0o640)
+        dst = fileops.move(src, self.tdir)
+        assert not os.path.exists(src)
+        self.check_file(dst, data)
+        assert os.stat(dst).st_mode & 0o777 == 0o640
+
+    def test_exdev_fallbacks(self):
+        self.exdev()
+        for unsupported in (["copy_file_range"],
+                            ["copy_file_range", "sendfile"]):
+            fileops._unsupported.update(unsupported)
+            src = os.path.join(self.tmpdir, "f")
+            self.mfile(src, b"x" * 100000)
+            dst = fileops.move(src, self.tdir)
+            self.check_file(dst, b"x" * 100000)
+            os.remove(dst)
+
+    def test_exdev_kernel_copy_returns_zero(self):
+        self.exdev()
+        saved = dict((name, getattr(os, name, None))
+            for name in ("copy_file_range", "sendfile"))
+        for name in saved:
+            setattr(os, name, lambda *args: 0)
+        try:
+            src = os.path.join(self.tmpdir, "f")
+            self.mfile(src, b"x" * 100000)
+            dst = fileops.move(src, self.tdir)
+        finally:
+            for name, func in saved.items():
+                if func is None:
+                    delattr(os, name)
+                else:
+                    setattr(os, name, func)
+        assert not os.path.exists(src)
+        self.check_file(dst, b"x" * 100000)
+
+    def test_exdev_incomplete_copy_leaves_source(self):
+        self.exdev()
+        copy_data = fileops._copy_data
+        fileops._copy_data = lambda fsrc, fdst, size: fdst.write(b"x")
+        try:
+            src = os.path.join(self.tmpdir, "f")
+            self.mfile(src)
+            with raises(IOError):
+                fileops.move(src, self.tdir)
+        finally:
+            fileops._copy_data = copy_data
+        self.check_file(src)
+        assert not os.path.exists(os.path.join(self.tdir, "f"))
+
+    def test_exdev_tree(self):
+        self.exdev()
+        src = os.path.join(self.tmpdir, "tree")
+        os.mkdir(src)
+        for d in ("a", "b", os.path.join("b", "c")):
+            os.mkdir(os.path.join(src, d))
+            for i in range(5):
+                self.mfile(os.path.join(src, d, "f%s" % i), d.encode("ascii"))
+        if hasattr(os, "symlink"):
+            os.symlink("b", os.path.join(src, "link"))
+        for d in ("a", os.path.join("b", "c"), "b", ""):
+            os.utime(os.path.join(src, d), (1000000000, 1000000000))
+        for workers in (1, 3):
+            dst = fileops.move(src, self.tdir, workers)
+            assert not os.path.exists(src)
+            for d in ("a", "b", os.path.join("b", "c")):
+                for i in range(5):
+                    self.check_file(os.path.join(dst, d, "f%s" % i),
+                        d.encode("ascii"))
+                assert os.stat(os.path.join(dst, d)).st_mtime == 1000000000
+            assert os.stat(dst).st_mtime == 1000000000
+            if hasattr(os, "symlink"):
+                assert os.readlink(os.path.join(dst, "link")) == "b"
+            # Move back for the second round.
+            os.rename = self.rename
+            os.rename(dst, src)
+            self.exdev()
+
+    def test_exdev_failure_leaves_source(self):
+        self.exdev()
+        src = os.path.join(self.tmpdir, "tree")
+        os.mkdir(src)
+        self.mfile(os.path.join(src, "f"))
+        copy_file = fileops.copy_file
+
+        def failing_copy_file(s, d):
+            raise OSError("Simulated failure")
+
+        fileops.copy_file = failing_copy_file
+        try:
+            with raises(OSError):
+                fileops.move(src, self.tdir)
+        finally:
+            fileops.copy_file = copy_file
+        self.check_file(os.path.join(src, "f"))
+        assert not os.path.exists(os.path.join(self.tdir, "tree"))
+
+    @mark.skipif("WINDOWS")
+    def test_exdev_fifo_leaves_source(self):
+        self.exdev()
+        src = os.path.join(self.tmpdir, "tree")
+        os.mkdir(src)
+        self.mfile(os.path.join(src, "f"))
+        os.mkfifo(os.path.join(src, "fifo"))
+        with raises(OSError):
+            fileops.move(src, self.tdir)
+        self.check_file(os.path.join(src, "f"))
+        assert os.path.exists(os.path.join(src, "fifo"))
+        assert not os.path.exists(os.path.join(self.tdir, "tree"))
+
+
+class TestTimeFilterExplain(object):
+    """Test TimeFilter.filter(explain=True).
+    """
+    now = DENSE_NOW
+
+    def test_explain(self):
+        items = [FilterItem(moddate=self.now - timedelta(hours=h))
+            for h in (0, 0.5, 1.2, 1.5, 25, 30, 24 * 9, 24 * 400)]
+        f = TimeFilter({"recent": 1, "hours": 2, "days": 2, "weeks": 2},
+            self.now)
+        f.filter(items, explain=True)
+        assert len(f.explanation) == len(items)
+        assert list(f.explanation) == [
+            ("recent", 0, True), ("recent", 0, False),
+            ("hours", 1, True), ("hours", 1, False),
+            ("days", 1, True), ("days", 1, False),
+            ("weeks", 1, True), (None, 0, False)]
+
+    def test_won_iff_accepted(self):
+        for presorted in (False, True):
+            rules = random_rules()
+            f = TimeFilter(rules, self.now)
+            fses = sorted(DENSE_FSES, key=lambda f: f.moddate)
+            a, r = f.filter(fses, presorted=presorted, explain=True)
+            a = set(a)
+            for i, fse in enumerate(fses):
+                catlabel, timecount, won = f.explanation[i]
+                assert won == (fse in a)
+                assert won or catlabel is None or fse in r
+
+
+class TestTimeFilterParallel(object):
+    """Test TimeFilter.filter(workers=N).
+    """
+    now = DENSE_NOW
+
+    def test_exact_result(self):
+        for workers in (2, 3):
+            f = TimeFilter(random_rules(), self.now)
+            assert f.filter(DENSE_FSES, workers=workers) == f.filter(
+                DENSE_FSES)
+
+    def test_more_workers_than_items(self):
+        fses = DENSE_FSES[:2]
+        f = TimeFilter({"recent": 1, "years": 2}, self.now)
+        assert f.filter(fses, workers=4) == f.filter(fses)
+
+    def test_not_with_presorted(self):
+        f = TimeFilter({"days": 1}, self.now)
+        with raises(TimeFilterError):
+            f.filter(DENSE_FSES, presorted=True, workers=2)
+
+    def test_serial_fallback(self):
+        f = TimeFilter(random_rules(), self.now)
+        saved = timefilter._MP_CONTEXT, timefilter.ProcessPoolExecutor
+        timefilter._MP_CONTEXT, timefilter.ProcessPoolExecutor = False, None
+        try:
+            assert f.filter(DENSE_FSES, workers=2) == f.filter(DENSE_FSES)
+        finally:
+            timefilter._MP_CONTEXT, timefilter.ProcessPoolExecutor = saved
+
+    def test_merge_shard_summaries(self):
+        # Summarize shards in this process, as the worker processes do.
+        f = TimeFilter(random_rules(), self.now)
+        moddates, seconds = timefilter._moddates(DENSE_FSES)
+        winners, recent = f._summarize(moddates, seconds=seconds)
+        n = len(DENSE_FSES)
+        timefilter._share_objs(DENSE_FSES)
+        try:
+            results = [timefilter._summarize_shard(dict(f.rules), self.now,
+                start, min(start + 500, n)) for start in range(0, n, 500)]
+        finally:
+            timefilter._share_objs(None)
+        assert set(s for _, s in results) == set([seconds])
+        mwinners, mrecent = timefilter._merge_summaries(
+            [summary for summary, _ in results], f.rules["recent"])
+        assert mwinners == winners
+        assert sorted(mrecent) == sorted(recent)
+
+    @mark.skipif("not FORK")
+    def test_forked(self):
+        f = TimeFilter(random_rules(), self.now)
+        assert f.filter(DENSE_FSES, workers=3) == f.filter(DENSE_FSES)
+
+    @mark.skipif("not FORK")
+    def test_concurrent_calls(self):
+        # Each call hands its own items to its worker processes.
+        f = TimeFilter(random_rules(), self.now)
+        inputs = [DENSE_FSES[:1000], DENSE_FSES[1000:]]
+        results = [None] * len(inputs)
+
+        def run(i):
+            results[i] = f.filter(inputs[i], workers=2)
+
+        threads = [threading.Thread(target=run, args=(i,))
+            for i in range(len(inputs))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert results == [f.filter(items) for items in inputs]
+
+
+class TestTimeFilterArray(object):
+    """Test the vectorized TimeFilter.filter_array().
+    """
+    now = DENSE_NOW
+
+    @mark.skipif("numpy is None")
+    def test_exact_rejected_order(self):
+        f = TimeFilter(random_rules(), self.now)
+        assert filter_array(f, DENSE_FSES)[1] == f.filter(DENSE_FSES)[1]
+
+    @mark.skipif("numpy is None")
+    def test_integer_seconds(self):
+        f = TimeFilter({"hours": 2}, datetime(1970, 1, 1, 3, 30))
+        a, r = f.filter_array(numpy.array([0, 3600, 3700, 7200], dtype="int64"))
+        assert list(a) == [2, 3]
+        assert list(r) == [0, 1]
+
+    def test_numpy_missing(self):
+        f = TimeFilter({"days": 1}, self.now)
+        np, timefilter.numpy = timefilter.numpy, None
+        try:
+            with raises(TimeFilterError):
+                f.filter_array([])
+        finally:
+            timefilter.numpy = np
@@ -10,8 +10,10 @@ Command line interface tests (execution through shell).
 from __future__ import unicode_literals
 import os
 import sys
+import json
 import time
 import logging
+from datetime import datetime, timedelta
 from itertools import chain
 from clitest import CmdlineInterfaceTest
 
@@ -502,6 +504,19 @@ class TestStringInterpretationMode(Base):
         t.assert_is_stdout(s + b"\0")
         t.assert_no_stderr()
 
+    def test_stdin_larger_than_chunk(self):
+        # 70000 records of 16 bytes exceed the stdin chunk size (1 MiB), so
+        # that records span chunk boundaries.
+        start = datetime(2000, 1, 1)
+        items = [(start + timedelta(seconds=i)).strftime(self.fmt)
+            for i in range(70000)]
+        for sep in ("\n", "\0"):
+            s = (sep.join(items) + sep).encode(STDINENC)
+            opt = "-0" if sep == "\0" else ""
+            t = self.run("-s %s --time-from-string %s years1" % (opt, self.fmt),
+                sin=s)
+            t.assert_is_stdout(s)
+
 
 class TestReferenceTime(Base):
     """Test -t/--reference-time parsing and logic."""
@@ -661,6 +676,15 @@ class TestFileActions(Base):
         t.assert_no_stderr()
         t.assert_paths_exist(list(chain(a_paths, r_paths_moved)))
 
+    def test_move_exists(self):
+        self.mfile("test")
+        self.mdir("movehere")
+        self.mfile("movehere/test")
+        t = self.run("--move movehere --move-workers 2 days1 test")
+        t.assert_in_stdout("test")
+        t.assert_in_stderr(["ERROR", "Cannot move 'test'", "already exists"])
+        t.assert_paths_exist(["test", "movehere/test"])
+
     def test_delete_files(self):
         self._delete_dirs_or_files(self.mfile)
 
@@ -699,6 +723,356 @@ class TestFileActions(Base):
         t.assert_no_stderr()
         t.assert_paths_not_exist(d)
 
+    def test_delete_recursive_workers(self):
+        d = "notempty"
+        now = time.time()
+        self.mdir(d, now)
+        for sub in ("a", "b", "c"):
+            self.mdir(os.path.join(d, sub), now)
+            self.mfile(os.path.join(d, sub, "testfile"), now)
+        t = self.run("-v --delete -r --delete-workers 3 days1 %s" % d)
+        t.assert_in_stdout(d)
+        t.assert_in_stderr(["Removed 7 entries of 'notempty' in"])
+        t.assert_paths_not_exist(d)
+
+
+class TestState(Base):
+    """Test incremental mode (--state).
+    """
+    def mtime(self, hour, minute):
+        return time.mktime(datetime(2000, 1, 1, hour, minute).timetuple())
+
+    def test_not_with_accepted(self):
+        t = self.run("-a --state state.json days1 .", rc=1)
+        t.assert_in_stderr(["ERROR", "--state not allowed"])
+
+    def test_not_with_string_mode(self):
+        t = self.run(("--state state.json --time-from-string %Y days1 "
+            "2000"), rc=1)
+        t.assert_in_stderr(["ERROR", "--state not allowed"])
+
+    def test_requires_action(self):
+        t = self.run("--state state.json days1 .", rc=1)
+        t.assert_in_stderr(["ERROR", "--state requires -d/--delete"])
+
+    def test_invalid_state_file_is_ignored(self):
+        self.clitest.add_file("state.json", b"{")
+        self.mfile("a")
+        t = self.run("-d --state state.json years1 a")
+        t.assert_is_stdout("a\n")
+        t.assert_in_stderr(["ERROR", "Ignoring state file"])
+        t.assert_paths_not_exist("a")
+
+    def test_preview_then_action(self):
+        self.mdir("items")
+        self.mfile("items/a", self.mtime(10, 10))
+        self.mfile("items/b", self.mtime(10, 40))
+        args = "-t 20000101-120000 hours2 items/a items/b"
+        # A preview cannot record state, so that it does not mark the
+        # rejected items as handled.
+        t = self.run("--state state.json %s" % args, rc=1)
+        t.assert_paths_exist(["items/a", "items/b"])
+        t = self.run(args)
+        t.assert_is_stdout("items/a\n")
+        t = self.run("-d --state state.json %s" % args)
+        t.assert_is_stdout("items/a\n")
+        t.assert_paths_not_exist("items/a")
+        t.assert_paths_exist("items/b")
+
+    def test_failed_action_is_retried(self):
+        self.mdir("items")
+        self.mdir("items/a", self.mtime(10, 10))
+        self.mfile("items/a/f")
+        os.utime(os.path.join(self.rundir, "items/a"),
+            (self.mtime(10, 10), self.mtime(10, 10)))
+        self.mfile("items/b", self.mtime(10, 40))
+        args = "-d --state state.json hours2 items/a items/b"
+        t = self.run("-t 20000101-120000 %s" % args)
+        t.assert_is_stdout("items/a\n")
+        t.assert_in_stderr(["ERROR", "Cannot rmdir"])
+        # The item directory is unchanged, but the failed item is not
+        # considered handled.
+        os.remove(os.path.join(self.rundir, "items/a/f"))
+        os.utime(os.path.join(self.rundir, "items/a"),
+            (self.mtime(10, 10), self.mtime(10, 10)))
+        t = self.run("-t 20000101-120100 %s" % args)
+        t.assert_is_stdout("items/a\n")
+        t.assert_no_stderr()
+        t.assert_paths_not_exist("items/a")
+
+    def test_incremental_runs(self):
+        self.mdir("items")
+        self.mfile("items/a", self.mtime(10, 10))
+        self.mfile("items/b", self.mtime(10, 40))
+        args = "--delete --state state.json hours2"
+
+        # First run: `a` and `b` are in the same 2-hour bucket.
+        t = self.run("-t 20000101-120000 %s items/a items/b" % args)
+        t.assert_is_stdout("items/a\n")
+        t.assert_no_stderr()
+        t.assert_paths_not_exist("items/a")
+
+        # The previous run has deleted an item, the directory has changed.
+        # `b` is known from the previous run.
+        t = self.run("-vv -t 20000101-120500 %s items/b" % args)
+        t.assert_no_stdout()
+        t.assert_in_stderr("Accepted in previous run: 'items/b'")
+
+        # Nothing has changed since, all buckets are the same.
+        t = self.run("-v -t 20000101-120600 %s items/b" % args)
+        t.assert_no_stdout()
+        t.assert_in_stderr("Nothing changed since previous run")
+
+        # New item: only `c` is accessed, `b` is known from previous run.
+        self.mfile("items/c", self.mtime(11, 20))
+        t = self.run("-vv -t 20000101-121000 %s items/b items/c" % args)
+        t.assert_no_stdout()
+        t.assert_in_stderr("Accepted in previous run: 'items/b'")
+        t.assert_paths_exist(["items/b", "items/c"])
+
+        # One hour later, `b` leaves the 2-hour bucket.
+        t = self.run("-t 20000101-130000 %s items/b items/c" % args)
+        t.assert_is_stdout("items/b\n")
+        t.assert_no_stderr()
+        t.assert_paths_not_exist("items/b")
+        t.assert_paths_exist("items/c")
+
+    def test_different_items_in_unchanged_directory(self):
+        self.mdir("items")
+        self.mfile("items/a1", self.mtime(10, 10))
+        self.mfile("items/b1", self.mtime(10, 20))
+        self.mfile("items/b2", self.mtime(10, 40))
+        args = "-d --state state.json -t 20000101-120000 hours2"
+        t = self.run("%s items/a1" % args)
+        t.assert_no_stdout()
+        # The directory has not changed, but other items are provided.
+        t = self.run("-v %s items/b1 items/b2" % args)
+        t.assert_is_stdout("items/b1\n")
+        t.assert_not_in_stderr("Nothing changed since previous run")
+        t.assert_paths_not_exist("items/b1")
+
+    def test_older_item_is_not_classified(self):
+        self.mdir("items")
+        self.mfile("items/a", self.mtime(10, 10))
+        args = "-d --state state.json -t 20000101-120000 hours2"
+        self.run("%s items/a" % args)
+        # An item older than all items of the previous run is considered
+        # handled, even in a changed directory.
+        self.mfile("items/old", self.mtime(9, 0))
+        t = self.run("-v %s items/a items/old" % args)
+        t.assert_no_stdout()
+        t.assert_in_stderr("Skipped 1 item(s) not newer than")
+        t.assert_paths_exist("items/old")
+
+    def test_item_added_during_run(self):
+        self.mdir("items")
+        self.mfile("items/a", self.mtime(10, 10))
+        args = "-d --state state.json -t 20000101-120000 hours2 --scan items"
+        t = self.run(args)
+        t.assert_no_stdout()
+        # Simulate an item that has been added after the directory has been
+        # listed: restore the directory mtime recorded in the state file.
+        with open(os.path.join(self.rundir, "state.json")) as f:
+            mtime = json.load(f)["dirs"]["items"]
+        self.mfile("items/b", self.mtime(10, 40))
+        os.utime(os.path.join(self.rundir, "items"), (mtime, mtime))
+        t = self.run(args)
+        t.assert_is_stdout(os.path.join("items", "a") + "\n")
+        t.assert_paths_exist("items/b")
+
+
+class TestExplain(Base):
+    """Test --explain.
+    """
+    def test_explain(self):
+        now = time.time()
+        self.mfile("a", now - 60 * 60 * 24 * 2)
+        self.mfile("b", now - 60 * 60 * 24 * 400)
+        self.mfile("c", now)
+        t = self.run("--explain recent1,days2 a b c")
+        t.assert_is_stdout("b\n")
+        t.assert_is_stderr(
+            "days2     won  a\n-         -    b\nrecent    won  c\n")
+
+
+class TestScan(Base):
+    """Test --scan DIR and --recursive.
+    """
+    def setup_items(self):
+        now = time.time()
+        self.mdir("items")
+        self.mdir("items/sub")
+        self.mfile("items/a", now - 60 * 60 * 24 * 3)
+        self.mfile("items/b", now - 60 * 60 * 24 * 2)
+        self.mfile("items/sub/c", now - 60 * 60 * 24 * 2 - 60)
+        self.mfile("items/sub/d", now)
+
+    def test_scan(self):
+        self.setup_items()
+        t = self.run("--scan items days2")
+        t.assert_is_stdout("items/a\nitems/sub\n")
+        t.assert_no_stderr()
+
+    def test_scan_recursive(self):
+        self.setup_items()
+        t = self.run("--scan items --recursive -d recent1,days2")
+        t.assert_is_stdout("items/a\nitems/sub/c\n")
+        t.assert_paths_not_exist(["items/a", "items/sub/c"])
+        t.assert_paths_exist(["items/b", "items/sub/d"])
+
+    def test_scan_with_items(self):
+        self.setup_items()
+        t = self.run("--scan items days2 items/a", rc=1)
+        t.assert_in_stderr(["ERROR", "No ITEM must be provided"])
+
+    def test_scan_with_stdin(self):
+        self.setup_items()
+        t = self.run("--scan items -s days2", rc=1)
+        t.assert_in_stderr(["ERROR", "-s/--stdin not allowed"])
+
+    def test_recursive_without_scan(self):
+        t = self.run("--recursive days2 .", rc=1)
+        t.assert_in_stderr(["ERROR", "--recursive not allowed without --scan"])
+
+    def test_scan_invalid_dir(self):
+        t = self.run("--scan nonexistent days2", rc=1)
+        t.assert_in_stderr(["ERROR", "Cannot scan directory"])
+
+
+class TestStatWorkers(Base):
+    """Test --stat-workers N.
+    """
+    expected = "".join("items/f%s\n" % i for i in range(4, 10))
+
+    def setup_items(self):
+        now = time.time()
+        self.mdir("items")
+        for i in range(10):
+            self.mfile("items/f%s" % i, now - 60 * 60 * 24 * i)
+
+    def test_same_as_serial(self):
+        self.setup_items()
+        items = " ".join("items/f%s" % i for i in range(10))
+        t = self.run("recent1,days3 %s" % items)
+        t.assert_is_stdout(self.expected)
+        t = self.run("--stat-workers 4 recent1,days3 %s" % items)
+        t.assert_is_stdout(self.expected)
+        t.assert_no_stderr()
+
+    def test_scan(self):
+        self.setup_items()
+        t = self.run("--scan items --stat-workers 3 recent1,days3")
+        t.assert_is_stdout(self.expected)
+
+    def test_access_error(self):
+        self.setup_items()
+        t = self.run("--stat-workers 4 days3 items/f0 nonexistent items/f1",
+            rc=1)
+        t.assert_in_stderr(["ERROR", "Cannot access 'nonexistent'"])
+
+    def test_invalid(self):
+        t = self.run("--stat-workers 0 days3 .", rc=1)
+        t.assert_in_stderr(["ERROR", "--stat-workers must be at least 1"])
+
+
+class TestActionWorkers(Base):
+    """Test --action-workers N.
+    """
+    def setup_items(self):
+        now = time.time()
+        self.mdir("items")
+        for i in range(50):
+            self.mfile("items/f%02d" % i, now - 60 * 60 * 24 * i)
+
+    def test_delete(self):
+        self.setup_items()
+        items = " ".join("items/f%02d" % i for i in range(50))
+        t = self.run("--action-workers 4 -d days10 %s" % items)
+        rejected = ["items/f%02d" % i for i in chain([0], range(11, 50))]
+        t.assert_is_stdout("".join("%s\n" % p for p in rejected))
+        t.assert_no_stderr()
+        t.assert_paths_not_exist(rejected)
+        t.assert_paths_exist(["items/f%02d" % i for i in range(1, 11)])
+
+    def test_move(self):
+        self.setup_items()
+        self.mdir("target")
+        t = self.run("--scan items --action-workers 3 -m target recent1,days48")
+        t.assert_is_stdout("items/f49\n")
+        t.assert_paths_exist(["target/f49", "items/f48"])
+
+    def test_errors_in_order(self):
+        for d in ("a", "b", "c"):
+            self.mdir(d)
+            self.mfile("%s/f" % d)
+        t = self.run("--action-workers 2 -d days1 a b c")
+        t.assert_is_stdout("a\nb\nc\n")
+        t.assert_in_stderr(["Cannot rmdir"])
+        e = t.rawerr
+        assert e.index(b"'a'") < e.index(b"'b'") < e.index(b"'c'")
+
+    def test_invalid(self):
+        t = self.run("--action-workers 0 -d days3 .", rc=1)
+        t.assert_in_stderr(["ERROR", "--action-workers must be at least 1"])
+
+
+class TestStatsJson(Base):
+    """Test --stats-json FILE.
+    """
+    def stats(self):
+        with open(os.path.join(self.rundir, "stats.json"), "rb") as f:
+            return json.loads(f.read().decode("utf-8"))
+
+    def test_stdin_delete(self):
+        self.mfile("a")
+        self.mfile("b")
+        t = self.run("--stats-json stats.json -s -d days1",
+            sin="a\nb\n".encode(STDINENC))
+        t.assert_is_stdout("a\nb\n")
+        t.assert_paths_not_exist(["a", "b"])
+        stats = self.stats()
+        assert stats["counters"] == {"items_read": 2, "stdin_bytes": 4,
+            "stat_calls": 2, "parse_failures": 0, "actions_attempted": 2,
+            "actions_failed": 0, "bytes_written": 4}
+        assert sorted(stats["stages"]) == [
+            "act", "bootstrap", "categorize", "collect"]
+        assert stats["total"] >= sum(stats["stages"].values()) * 0.99
+
+    def test_written_upon_error(self):
+        t = self.run("--stats-json stats.json --time-from-string %Y days1 "
+            "nonsense", rc=1)
+        t.assert_in_stderr("Error while parsing time")
+        stats = self.stats()
+        assert stats["counters"]["parse_failures"] == 1
+        assert sorted(stats["stages"]) == ["bootstrap", "collect"]
+
+
+class TestProfile(Base):
+    """Test --profile[=FILE].
+    """
+    def test_profile_stderr(self):
+        t = self.run("--profile days1 .")
+        t.assert_is_stdout(".\n")
+        t.assert_in_stderr(["function calls", "cumulative", "prepare_input"])
+
+    def test_profile_file(self):
+        t = self.run("--profile=run.prof days1 .")
+        t.assert_is_stdout(".\n")
+        t.assert_no_stderr()
+        t.assert_paths_exist("run.prof")
+
+    def test_profile_file_abbreviated(self):
+        t = self.run("--prof=run.prof days1 .")
+        t.assert_is_stdout(".\n")
+        t.assert_paths_exist("run.prof")
+        t = self.run("--prof days1 .")
+        t.assert_is_stdout(".\n")
+        t.assert_in_stderr(["function calls", "cumulative"])
+
+    def test_profile_file_error(self):
+        t = self.run("--profile=nodir/run.prof days1 .", rc=1)
+        t.assert_in_stderr(["ERROR", "Cannot write profile"])
+
 
 class TestMisc(Base):
     """Tests that do not fit in other categories.
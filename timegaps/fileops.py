@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+# Copyright 2014 Jan-Philip Gehrcke. See LICENSE file for details.
+
+
+"""timegaps.fileops -- file system actions on rejected/accepted items."""
+
+
+import os
+import sys
+import stat
+import errno
+import shutil
+import logging
+from collections import deque
+
+# Only required for parallel removal and copying. Not part of the Python 2
+# standard library, but available as a package (futures).
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
+
+
+log = logging.getLogger("fileops")
+
+
+# Removal relative to directory file descriptors requires `os.scandir()` on
+# file descriptors (Python 3.7+) and `dir_fd` support of `os.open()`,
+# `os.unlink()` and `os.rmdir()` (not available on Windows).
+FD_BASED = (hasattr(os, "scandir") and
+    os.scandir in getattr(os, "supports_fd", ()) and
+    set([os.open, os.unlink, os.rmdir]) <= getattr(
+        os, "supports_dir_fd", set()))
+
+_DIRFLAGS = (os.O_RDONLY | getattr(os, "O_DIRECTORY", 0) |
+    getattr(os, "O_NOFOLLOW", 0))
+
+
+def remove_tree(path, workers=1):
+    """Remove directory `path` and all of its contents, without following
+    symbolic links. Return the number of removed entries, including `path`
+    itself. Raise `OSError` upon the first error (e.g. if `path` is a symbolic
+    link or not a directory).
+
+    Entries are removed relative to the file descriptor of their open parent
+    directory (`dir_fd`), so that the path of an entry is never resolved
+    again. With `workers` > 1, subtrees are removed in parallel by a pool of
+    threads (requires concurrent.futures). Without `dir_fd` support, fall
+    back to serial removal by path.
+    """
+    if not FD_BASED:
+        return _remove_tree_by_path(path)
+    topfd = os.open(path, _DIRFLAGS)
+    try:
+        if workers > 1 and ThreadPoolExecutor is not None:
+            count = _remove_contents_parallel(topfd, workers)
+        else:
+            count = _remove_contents(topfd)
+    finally:
+        os.close(topfd)
+    os.rmdir(path)
+    return count + 1
+
+
+def _scan(fd):
+    """Unlink all entries but subdirectories of the directory opened as `fd`.
+    Return tuple (number of unlinked entries, list of subdirectory names).
+    """
+    with os.scandir(fd) as it:
+        entries = list(it)
+    subdirs = []
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            subdirs.append(entry.name)
+        else:
+            os.unlink(entry.name, dir_fd=fd)
+    return len(entries) - len(subdirs), subdirs
+
+
+def _remove_contents(fd):
+    """Remove all entries of the directory opened as `fd`, recursively.
+    Return the number of removed entries.
+    """
+    count, subdirs = _scan(fd)
+    for name in subdirs:
+        count += _remove_subdir(fd, name)
+    return count
+
+
+def _remove_subdir(fd, name):
+    """Remove subdirectory `name` of the directory opened as `fd`,
+    recursively. Return the number of removed entries.
+    """
+    subfd = os.open(name, _DIRFLAGS, dir_fd=fd)
+    try:
+        count = _remove_contents(subfd)
+    finally:
+        os.close(subfd)
+    os.rmdir(name, dir_fd=fd)
+    return count + 1
+
+
+def _remove_contents_parallel(fd, workers):
+    """Like `_remove_contents()`, but expand the tree breadth-first until
+    there are enough subtrees to keep `workers` threads busy, and remove
+    these subtrees in parallel. The expanded directories are kept open and
+    removed last, deepest first.
+    """
+    count, subdirs = _scan(fd)
+    # Subtrees to be removed by the pool: (parent fd, name) tuples.
+    frontier = deque((fd, name) for name in subdirs)
+    # Expanded directories: (parent fd, name, fd) tuples, parents first.
+    expanded = []
+    try:
+        while frontier and len(frontier) < 4 * workers and (
+                len(expanded) < 64 * workers):
+            parentfd, name = frontier.popleft()
+            subfd = os.open(name, _DIRFLAGS, dir_fd=parentfd)
+            expanded.append((parentfd, name, subfd))
+            n, names = _scan(subfd)
+            count += n
+            frontier.extend((subfd, s) for s in names)
+        log.debug("Remove %s subtree(s) using %s threads.", len(frontier),
+            workers)
+        with ThreadPoolExecutor(workers) as pool:
+            futures = [pool.submit(_remove_subdir, parentfd, name)
+                for parentfd, name in frontier]
+            count += sum(f.result() for f in futures)
+        while expanded:
+            parentfd, name, subfd = expanded.pop()
+            os.close(subfd)
+            os.rmdir(name, dir_fd=parentfd)
+            count += 1
+    finally:
+        for _, _, subfd in expanded:
+            os.close(subfd)
+    return count
+
+
+def _remove_tree_by_path(path):
+    """Fallback for `remove_tree()` without `dir_fd` support."""
+    if os.path.islink(path):
+        raise OSError("Cannot remove symbolic link to directory: %s" % path)
+    count = 0
+
+    def onerror(e):
+        raise e
+
+    for dirpath, dirnames, filenames in os.walk(path, topdown=False,
+            onerror=onerror):
+        for name in dirnames:
+            p = os.path.join(dirpath, name)
+            # os.walk() lists symbolic links to directories as directories,
+            # but does not descend into them.
+            if os.path.islink(p):
+                os.remove(p)
+            else:
+                os.rmdir(p)
+        for name in filenames:
+            os.remove(os.path.join(dirpath, name))
+        count += len(dirnames) + len(filenames)
+    os.rmdir(path)
+    return count + 1
+
+
+def move(path, tdir, workers=1):
+    """Move file system entry `path` into directory `tdir`, like
+    `shutil.move()`. Return the new path. Raise `OSError` if the destination
+    exists or upon the first error.
+
+    Try `os.rename()` first. If `tdir` is on another file system (EXDEV),
+    copy `path` (recursively, without following symbolic links) including
+    metadata, then remove it. File data is copied by the kernel where
+    possible (see `copy_file()`). With `workers` > 1, the files of a
+    directory are copied in parallel (requires concurrent.futures). If
+    copying fails, the partial copy is removed and `path` is left intact.
+    """
+    dst = os.path.join(tdir, os.path.basename(path.rstrip(os.sep)))
+    if os.path.lexists(dst):
+        raise OSError(errno.EEXIST, "Destination path already exists", dst)
+    try:
+        os.rename(path, dst)
+        return dst
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    log.debug("Cross-device move, copy '%s' to '%s'.", path, dst)
+    st = os.lstat(path)
+    try:
+        if stat.S_ISDIR(st.st_mode):
+            copy_tree(path, dst, workers)
+        else:
+            copy_file(path, dst)
+    except (OSError, IOError):
+        _remove_partial(dst)
+        raise
+    if stat.S_ISDIR(st.st_mode):
+        remove_tree(path, workers)
+    else:
+        os.unlink(path)
+    return dst
+
+
+def _remove_partial(dst):
+    """Remove the partial copy `dst` of a failed cross-device move."""
+    try:
+        if os.path.isdir(dst) and not os.path.islink(dst):
+            remove_tree(dst)
+        elif os.path.lexists(dst):
+            os.unlink(dst)
+    except OSError as e:
+        log.error("Cannot remove partial copy '%s': %s", dst, e)
+
+
+def copy_tree(src, dst, workers=1):
+    """Copy directory `src` to new directory `dst` recursively, without
+    following symbolic links, preserving metadata (see `copy_file()`). With
+    `workers` > 1, files are copied in parallel by a pool of threads.
+    """
+    files = []
+    dirs = []
+    for dirpath, dirnames, filenames in os.walk(src, onerror=_raise):
+        if dirpath == src:
+            target = dst
+        else:
+            target = os.path.join(dst, os.path.relpath(dirpath, src))
+        os.mkdir(target)
+        dirs.append((dirpath, target))
+        # os.walk() lists symbolic links to directories as directories, but
+        # does not descend into them.
+        links = [name for name in dirnames
+            if os.path.islink(os.path.join(dirpath, name))]
+        for name in filenames + links:
+            files.append((os.path.join(dirpath, name),
+                os.path.join(target, name)))
+    log.debug("Copy %s director(y/ies) and %s file(s) from '%s' to '%s'.",
+        len(dirs), len(files), src, dst)
+    if workers > 1 and ThreadPoolExecutor is not None:
+        with ThreadPoolExecutor(workers) as pool:
+            for _ in pool.map(lambda f: copy_file(*f), files):
+                pass
+    else:
+        for f in files:
+            copy_file(*f)
+    # Copy directory metadata last (deepest first), as creating entries
+    # modifies the mtime of their parent directory.
+    for dirpath, target in reversed(dirs):
+        _copystat(dirpath, target)
+
+
+def _raise(e):
+    raise e
+
+
+def copy_file(src, dst):
+    """Copy file `src` to new file `dst`, preserving metadata (mode bits,
+    access and modification time, flags and extended attributes, like
+    `shutil.copy2()`). Symbolic links are copied as symbolic links.
+
+    Copy file data in the kernel via `os.copy_file_range()` (Python 3.8+,
+    Linux) or `os.sendfile()` (Python 3.3+) where supported, and in user
+    space otherwise. Raise `OSError` if `src` is neither a regular file nor
+    a symbolic link (opening a named pipe would block, for instance).
+    """
+    if os.path.islink(src):
+        os.symlink(os.readlink(src), dst)
+        _copystat(src, dst)
+        return
+    if not stat.S_ISREG(os.lstat(src).st_mode):
+        raise OSError(errno.EINVAL, "Not a regular file, cannot copy", src)
+    with open(src, "rb") as fsrc:
+        fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "wb") as fdst:
+            size = os.fstat(fsrc.fileno()).st_size
+            _copy_data(fsrc, fdst, size)
+            fdst.flush()
+            # Never let the caller remove `src` after an incomplete copy.
+            copied = os.fstat(fdst.fileno()).st_size
+            if copied != size:
+                raise IOError(errno.EIO, "Incomplete copy (%s of %s bytes)" % (
+                    copied, size), dst)
+    _copystat(src, dst)
+
+
+# Kernel-side copy functions that have failed with an error indicating lack
+# of support (e.g. copy_file_range() across file systems on Linux < 5.3).
+_unsupported = set()
+
+
+def _copy_data(fsrc, fdst, size):
+    """Copy `size` bytes (at least, until EOF) from file object `fsrc` to
+    file object `fdst`, using the fastest supported method. On some file
+    systems, the kernel-side copy functions report EOF right away. As in
+    CPython's shutil, a function that copies nothing from a non-empty file is
+    therefore not trusted, and the next method is used for this file.
+    """
+    infd, outfd = fsrc.fileno(), fdst.fileno()
+    for name in ("copy_file_range", "sendfile"):
+        func = getattr(os, name, None)
+        if func is None or name in _unsupported:
+            continue
+        copied = 0
+        try:
+            while True:
+                # Both functions advance the file offsets of both files.
+                if name == "sendfile":
+                    n = func(outfd, infd, None, max(size - copied, 1 << 23))
+                else:
+                    n = func(infd, outfd, max(size - copied, 1 << 23))
+                if n == 0:
+                    if copied == 0 and size > 0:
+                        log.debug("%s() copied nothing, try next method.",
+                            name)
+                        break
+                    return
+                copied += n
+        except OSError as e:
+            if copied or e.errno not in _UNSUPPORTED_ERRNOS:
+                raise
+            log.debug("%s() not supported: %s", name, e)
+            _unsupported.add(name)
+    shutil.copyfileobj(fsrc, fdst, 1 << 20)
+
+
+_UNSUPPORTED_ERRNOS = set(getattr(errno, name) for name in (
+    "EXDEV", "ENOSYS", "EINVAL", "ENOTSUP", "EOPNOTSUPP", "EBADF")
+    if hasattr(errno, name))
+
+
+def _copystat(src, dst):
+    """Copy metadata from `src` to `dst`, not following symbolic links."""
+    if sys.version < "3":
+        if not os.path.islink(src):
+            shutil.copystat(src, dst)
+        return
+    shutil.copystat(src, dst, follow_symlinks=False)
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+# Copyright 2014 Jan-Philip Gehrcke. See LICENSE file for details.
+
+
+"""timegaps.localtime -- fast conversion of Unix timestamps to local time.
+
+Local time is represented as "local seconds": the number of seconds since
+1970-01-01 00:00 local (wall clock) time, i.e. a Unix timestamp shifted by the
+UTC offset in effect at that time. Local seconds map to local calendar hours
+and days with integer arithmetic, and to the same naive datetime object as
+`datetime.datetime.fromtimestamp()` via `local_datetime()`.
+"""
+
+
+import time
+import calendar
+import datetime
+import logging
+from bisect import bisect_right
+
+
+log = logging.getLogger("localtime")
+
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+class UTCOffsets(object):
+    """Table of the local UTC offsets (DST transitions) over the range of
+    timestamps looked up so far. The table is extended on demand by sampling
+    `time.localtime()` once per `step` seconds and bisecting to the exact
+    transition second between two samples with different UTC offsets. Only
+    one transition per `step` is detected, which is not a limitation for any
+    real-world time zone.
+
+    The table only covers non-negative timestamps (`time.localtime()` fails
+    for negative ones on Windows) close to the current time or to the range
+    covered so far. The UTC offset at timestamps beyond (outliers, e.g. a file
+    dated 2446) is determined by a direct `time.localtime()` call, so that a
+    single outlier does not require sampling the range up to it.
+    """
+    step = 86400
+    # Extend the table by at least this much beyond a missing timestamp, so
+    # that subsequent timestamps usually hit the table. Each extension only
+    # samples the new range, so a small margin keeps the cost for few items
+    # low without adding cost for many items.
+    margin = 32 * 86400
+    # Extend the table to timestamps within this range around the current
+    # time, or at most this far beyond the range covered so far.
+    past = 10 * 365 * 86400
+    future = 365 * 86400
+    maxgap = 2 * 365 * 86400
+
+    def __init__(self):
+        # Transition timestamps (ascending) and UTC offsets in effect from
+        # that timestamp on. Valid for timestamps in [self._lo, self._hi).
+        self._starts = []
+        self._offsets = []
+        self._lo = self._hi = None
+
+    def offset(self, t):
+        """Return local UTC offset in seconds at Unix timestamp `t`."""
+        return self.interval(t)[2]
+
+    def interval(self, t):
+        """Return tuple `(start, end, offset)`: UTC offset `offset` is in
+        effect for (at least) all timestamps in [start, end), including `t`.
+        """
+        if self._lo is None or not self._lo <= t < self._hi:
+            if not self._extensible(t):
+                t = int(t // 1)
+                return t, t + 1, _utcoffset(t)
+            self._extend(t)
+        i = bisect_right(self._starts, t)
+        end = self._starts[i] if i < len(self._starts) else self._hi
+        return self._starts[i - 1], end, self._offsets[i - 1]
+
+    def _extensible(self, t):
+        """Return True if the table may be extended to timestamp `t`."""
+        if t < 0:
+            return False
+        now = time.time()
+        if now - self.past <= t < now + self.future:
+            return True
+        return self._lo is not None and (
+            self._lo - self.maxgap <= t < self._hi + self.maxgap)
+
+    def _extend(self, t):
+        t = int(t // 1)
+        lo = max(t - self.margin, 0)
+        if self._lo is None:
+            self._starts, self._offsets = self._sample(lo, t + self.margin)
+            self._lo, self._hi = lo, t + self.margin
+        elif t < self._lo:
+            starts, offsets = self._sample(lo, self._lo)
+            self._merge(starts, offsets, self._starts, self._offsets)
+            self._lo = lo
+        else:
+            starts, offsets = self._sample(self._hi, t + self.margin)
+            self._merge(self._starts, self._offsets, starts, offsets)
+            self._hi = t + self.margin
+        log.debug("UTC offset table covers [%s, %s) with %s transition(s).",
+            self._lo, self._hi, len(self._starts) - 1)
+
+    def _merge(self, starts1, offsets1, starts2, offsets2):
+        """Concatenate two adjacent tables, dropping the first entry of the
+        second one if it does not change the offset.
+        """
+        if offsets2[0] == offsets1[-1]:
+            starts2, offsets2 = starts2[1:], offsets2[1:]
+        self._starts = starts1 + starts2
+        self._offsets = offsets1 + offsets2
+
+    def _sample(self, a, b):
+        """Return table (starts, offsets) for timestamps in [a, b)."""
+        starts = [a]
+        offsets = [_utcoffset(a)]
+        t = a
+        while t < b:
+            u = min(t + self.step, b)
+            o = _utcoffset(u)
+            if o != offsets[-1]:
+                # Find the first second with the new offset in (t, u].
+                lo, hi = t, u
+                while hi - lo > 1:
+                    mid = (lo + hi) // 2
+                    if _utcoffset(mid) == offsets[-1]:
+                        lo = mid
+                    else:
+                        hi = mid
+                starts.append(hi)
+                offsets.append(o)
+            t = u
+        return starts, offsets
+
+
+def _utcoffset(t):
+    """Return local UTC offset in seconds at integer Unix timestamp `t`."""
+    return calendar.timegm(time.localtime(t)) - t
+
+
+_offsets = UTCOffsets()
+# The most recently used (start, end, offset) interval of `_offsets`: items
+# tend to be clustered in time.
+_interval = (0, 0, 0)
+
+
+def local_seconds(t):
+    """Convert Unix timestamp `t` (seconds since epoch, int or float) to local
+    seconds.
+    """
+    global _interval
+    start, end, offset = _interval
+    if not start <= t < end:
+        _interval = start, end, offset = _offsets.interval(t)
+    return t + offset
+
+
+def local_datetime(s):
+    """Convert local seconds `s` to a naive local datetime object."""
+    return EPOCH + datetime.timedelta(seconds=s)
+
+
+def seconds(t):
+    """Convert naive local datetime object `t` to local seconds."""
+    return (t - EPOCH).total_seconds()
@@ -30,6 +30,14 @@ Input:
         valid file system entries. In a different mode of operation, ITEM
         values are treated as simple strings w/o path validation, in which case
         the "modification time" must be parsable from the string itself.
+
+        Instead of providing ITEMs, the entries of a directory can be used as
+        items with --scan DIR. All entries (including hidden ones) of type
+        file, directory or symbolic link are used, in order of their name.
+        Their type and modification time are retrieved along with the
+        directory listing, where possible. With --recursive, subdirectories
+        are descended into (symbolic links are not followed), and all entries
+        except for directories are used as items.
     RULES:
         The rules define the amount of items to be accepted for certain time
         categories. All other items become rejected. Supported time categories
@@ -45,6 +53,11 @@ Output:
         item separator may be set to the NUL character. Log output and error
         messages are written to stderr.
 
+        With --explain, one line per item (in input order) is written to
+        stderr in addition: the bucket the item has been put into (for
+        example "days3", "recent" or "-" if none), "won" if the item has been
+        accepted in that bucket ("lost" otherwise) and the item string.
+
 
 Actions:
         An action can be performed on each item, based on its classification.
@@ -56,16 +69,39 @@ Actions:
 
         Remarks: the --time-from-string mode is not allowed in combination with
         --delete or --move. The --move action renames within one file system and
-        copy-deletes in all other cases (cf. bit.ly/shutilmove). File system
-        interaction errors (e.g. due to invalid permissions) are written to
-        stderr and the program proceeds. By default, the deletion of directories
-        requires the directory to be empty. Entire directory trees can be
-        removed using -r/--recursive-delete.
+        copy-deletes in all other cases (preserving metadata; file data is
+        copied by the kernel where possible). File system interaction errors
+        (e.g. due to invalid permissions) are written to stderr and the program
+        proceeds. By default, the deletion of directories requires the
+        directory to be empty. Entire directory trees can be removed using
+        -r/--recursive-delete.
 
         TODO: Add --strict mode (or something like that) that makes file system
         entry action errors fatal?
 
 
+Incremental mode:
+        With --state FILE, the accepted items, the reference time, the newest
+        item modification time, the modification times of the item
+        directories and digests of the item sets in these directories are
+        written to FILE. A later run with the same rules reads FILE and only
+        classifies the items accepted previously (without accessing them) plus
+        items newer than all items of the previous run. Items in directories
+        that have not changed since the previous run (same modification time,
+        same set of items) are not accessed at all. If no item directory has
+        changed and the reference time is within the same hour as before,
+        nothing is done. Directories in which items have been deleted or moved
+        are considered changed in the next run.
+
+        Items rejected in a previous run are considered handled (deleted or
+        moved) and are not reported again. Therefore, --state requires
+        -d/--delete or -m/--move, and is not allowed in combination with
+        -a/--accepted or --time-from-string. If an action fails, the newest
+        item modification time and the directory modification times are not
+        updated, so that the next run retries the action. FILE should not be
+        located in one of the item directories.
+
+
 Time categorization method:
         Each item provided as input becomes classified as either accepted or
         rejected, based on its corresponding timestamp and according to the
@@ -149,14 +185,19 @@ Exit status:
 
 import os
 import sys
-import shutil
 import argparse
 import logging
 import re
+import json
 import time
 from datetime import datetime
 from .timegaps import FileSystemEntry, FilterItem
 from .timefilter import TimeFilter, TimeFilterError
+from .timediff import indices
+from . import localtime
+from .state import RunState, RunStateError
+from .fileops import remove_tree, move
+from .timeparse import TimeParser
 
 
 # Make the same code base run with Python 2 and 3.
@@ -164,13 +205,15 @@ if sys.version < '3':
     text_type = unicode
     binary_type = str
     stdout_write_bytes = sys.stdout.write
-    stdin_read_bytes_until_eof = sys.stdin.read
+    stderr_write_bytes = sys.stderr.write
+    stdin_read_bytes = sys.stdin.read
 else:
     text_type = str
     binary_type = bytes
     # http://docs.python.org/3/library/sys.html#sys.stdout
     stdout_write_bytes = sys.stdout.buffer.write
-    stdin_read_bytes_until_eof = sys.stdin.buffer.read
+    stderr_write_bytes = sys.stderr.buffer.write
+    stdin_read_bytes = sys.stdin.buffer.read
 
 
 WINDOWS = sys.platform == "win32"
@@ -178,6 +221,25 @@ if WINDOWS:
     import msvcrt
 
 
+# Only required for the --*-workers options. Not part of the Python 2 standard
+# library, but available as a package (futures).
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
+
+
+# scandir() is only required for --scan. Not part of the Python 2 standard
+# library, but available as a package.
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+
 log = logging.getLogger()
 log.setLevel(logging.ERROR)
 ch = logging.StreamHandler()
@@ -225,7 +287,74 @@ options = None
 
 
 def main():
-    parse_options()
+    """Run timegaps with the command line arguments of this process."""
+    return run(normalize_profile_args(sys.argv[1:]))
+
+
+def normalize_profile_args(argv):
+    """Return copy of `argv` with --profile (or an abbreviation of it)
+    replaced by --profile= (profile to stderr), so that --profile does not
+    consume a following argument as FILE.
+    """
+    # On Python 2, argv contains byte strings: compare with native strings,
+    # which does not require decoding (non-ASCII) arguments.
+    argv = list(argv)
+    for i, arg in enumerate(argv):
+        if arg == str("--"):
+            break
+        if arg.startswith(str("--p")) and str("--profile").startswith(arg):
+            argv[i] = str("--profile=")
+    return argv
+
+
+def profiled(func):
+    """Call `func()` under cProfile. Write the profile statistics to the
+    --profile FILE, or to stderr if FILE is empty.
+    """
+    import cProfile
+    import pstats
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func)
+    finally:
+        if options.profile:
+            try:
+                profiler.dump_stats(options.profile)
+            except (IOError, OSError) as e:
+                err("Cannot write profile: %s" % e)
+            log.info("Profile written to '%s'.", options.profile)
+        else:
+            sys.stderr.flush()
+            pstats.Stats(profiler, stream=sys.stderr).sort_stats(
+                "cumulative").print_stats(40)
+
+
+def run(argv=None):
+    """Parse command line arguments `argv` and process items. Write --stats-json
+    file, also upon error.
+    """
+    global stats
+    stats = Stats()
+    stats.stage("bootstrap")
+    parse_options(argv)
+    try:
+        if options.profile is None:
+            process()
+        else:
+            profiled(process)
+    finally:
+        stats.stop()
+        if options.stats_json is not None:
+            write_stats()
+
+
+def process():
+    """Run timegaps according to the parsed command line `options`, in four
+    stages: validate arguments and set up the time filter, collect items,
+    categorize them, and write the action items to stdout (performing the
+    file system action on each of them, if requested). With --state, skip
+    work that a previous run has already done, and record this run's state.
+    """
     if options.verbose == 1:
         log.setLevel(logging.INFO)
     elif options.verbose == 2:
@@ -271,7 +400,12 @@ def main():
     except ValueError as e:
         err("Error while parsing rules: '%s'." % e)
     log.info("Using rules: %s", rules)
-    if not options.stdin:
+    if options.scan is not None:
+        if options.stdin:
+            err("-s/--stdin not allowed in combination with --scan.")
+        if len(options.items) > 0:
+            err("No ITEM must be provided on command line (--scan is set).")
+    elif not options.stdin:
         if len(options.items) == 0:
             err("At least one ITEM must be provided (-s/--stdin not set).")
     else:
@@ -308,29 +442,103 @@ def main():
         if not options.delete:
             err("-r/--recursive-delete not allowed without -d/--delete.")
 
+    if options.stat_workers < 1:
+        err("--stat-workers must be at least 1.")
+    if options.action_workers < 1:
+        err("--action-workers must be at least 1.")
+    if options.delete_workers < 1:
+        err("--delete-workers must be at least 1.")
+    if options.move_workers < 1:
+        err("--move-workers must be at least 1.")
+    for opt, workers in (("--delete-workers", options.delete_workers),
+            ("--move-workers", options.move_workers)):
+        if workers > 1 and ThreadPoolExecutor is None:
+            err("%s requires concurrent.futures (Python 3.2+ or the futures "
+                "package)." % opt)
+
+    if options.scan is not None:
+        if options.time_from_string is not None:
+            err("--scan not allowed in combination with --time-from-string.")
+    elif options.recursive:
+        err("--recursive not allowed without --scan.")
+
+    runstate = None
+    if options.state is not None:
+        # The state of a previous run only covers accepted items which are
+        # assumed to stay in place, and rejected items which are assumed to
+        # have been handled. That is not compatible with acting on accepted
+        # items, and requires items to be paths.
+        if options.time_from_string is not None:
+            err("--state not allowed in combination with --time-from-string.")
+        if options.accepted:
+            err("--state not allowed in combination with -a/--accepted.")
+        if not (options.delete or options.move):
+            err("--state requires -d/--delete or -m/--move.")
+        runstate = load_state(rules, reference_time)
+
 
     # STAGE II: collect and validate items.
 
+    stats.stage("collect")
     log.info("Start collecting item(s).")
-    items = prepare_input()
+    entries = None
+    # With --state, take the directory mtimes before listing the items, so
+    # that an item added in the meantime changes its directory for the next
+    # run. Items from the command line or stdin have been listed before.
+    mtimes = None if options.state is None else {}
+    if options.scan is not None:
+        entries = scan_entries(options.scan, options.recursive, mtimes)
+        itemstrings = [e.path for e in entries]
+    else:
+        itemstrings = read_itemstrings()
+    stats.items_read = len(itemstrings)
+    if mtimes is not None:
+        for d, m in RunState.dir_mtimes(itemstrings).items():
+            mtimes.setdefault(d, m)
+    if runstate is not None:
+        # If the reference time is within the same hour as before, all
+        # category-timecount buckets are the same as in the previous run. If
+        # furthermore none of the item directories has changed (no items have
+        # been added or removed, and the same items are provided), the result
+        # would be the same, too.
+        digests = RunState.dir_digests(itemstrings)
+        runstate.unchanged_dirs = set(
+            d for d, digest in digests.items() if d in mtimes and
+            runstate.dirs.get(d) == mtimes[d] and
+            runstate.digests.get(d) == digest)
+        log.info("%s of %s item director(y/ies) unchanged since previous run.",
+            len(runstate.unchanged_dirs), len(digests))
+        samehour = indices(runstate.reftime)[0] == indices(reference_time)[0]
+        if samehour and len(runstate.unchanged_dirs) == len(digests):
+            log.info("Nothing changed since previous run, nothing to do.")
+            return
+    items = prepare_input(itemstrings, runstate, entries)
     log.info("Collected %s item(s).", len(items))
 
 
     # STAGE III: categorize items.
 
+    stats.stage("categorize")
     log.info("Start item classification.")
     try:
-        accepted, rejected = timefilter.filter(items)
+        accepted, rejected = timefilter.filter(items, explain=options.explain)
     except TimeFilterError as e:
         err("Error while filtering items: %s" % e)
+    if options.explain:
+        write_explanation(items, timefilter.explanation)
     log.info("Number of accepted items: %s", len(accepted))
     log.info("Number of rejected items: %s", len(rejected))
-    log.debug("Accepted item(s):\n%s", "\n".join("%s" % a for a in accepted))
-    log.debug("Rejected item(s):\n%s", "\n".join("%s" % r for r in rejected))
+    if log.isEnabledFor(logging.DEBUG):
+        # Formatting an item creates its `moddate` datetime object.
+        log.debug("Accepted item(s):\n%s",
+            "\n".join("%s" % a for a in accepted))
+        log.debug("Rejected item(s):\n%s",
+            "\n".join("%s" % r for r in rejected))
 
 
     # STAGE IV: item action and item output.
 
+    stats.stage("act")
     # - Determine "action items": either the rejected or the accepted ones
     # - For each action item:
     #       - write item to stdout
@@ -346,114 +554,307 @@ def main():
     # set by the user, which is ideal behavior.
     outenc = sys.stdout.encoding
     sep = "\0" if options.nullsep else "\n"
-    sep_bytes = sep.encode(outenc)
     actionitems = rejected if not options.accepted else accepted
-    for ai in actionitems:
-        # If `ai` is of `FileSystemEntry` type, then `path` attribute can be
-        # unicode or bytes. If bytes, then write them as they are. If unicode,
-        # encode with `outenc`.
-        if isinstance(ai, FileSystemEntry):
-            itemstring_bytes = ai.path
-            if isinstance(ai.path, text_type):
-                itemstring_bytes = ai.path.encode(outenc)
+    if (options.delete or options.move) and options.action_workers > 1:
+        act_concurrently(actionitems, outenc, sep)
+    elif options.delete or options.move:
+        # Report each item before acting on it: flush stdout, so that an
+        # item is never modified without having been written.
+        for ai in actionitems:
+            write_items([ai], outenc, sep)
+            sys.stdout.flush()
+            action(ai)
+    else:
+        write_items(actionitems, outenc, sep)
+
+    if options.state is not None:
+        save_state(rules, reference_time, itemstrings, items, accepted,
+            rejected, runstate, mtimes)
+
+
+def item_bytes(item, enc):
+    """Return item string of `item` as byte string."""
+    # If `item` is of `FileSystemEntry` type, then `path` attribute can be
+    # unicode or bytes. If bytes, then return them as they are. If unicode,
+    # encode with `enc`.
+    if isinstance(item, FileSystemEntry):
+        if isinstance(item.path, text_type):
+            return item.path.encode(enc)
+        return item.path
+    # `item` is of type FilterItem: `text` attribute always is unicode.
+    return item.text.encode(enc)
+
+
+# Number of items encoded and written to stdout at once.
+OUTPUT_BLOCKSIZE = 1 << 14
+
+
+def write_items(items, enc, sep):
+    """Write item strings of `items`, each terminated by `sep`, to stdout.
+    Encode and write blocks of `OUTPUT_BLOCKSIZE` items at once. Item strings
+    of one run are either all unicode or all bytes (see `item_bytes()`).
+    """
+    sep_bytes = sep.encode(enc)
+    for start in range(0, len(items), OUTPUT_BLOCKSIZE):
+        block = items[start:start + OUTPUT_BLOCKSIZE]
+        if isinstance(block[0], FileSystemEntry):
+            strings = [item.path for item in block]
         else:
-            # `ai` is of type FilterItem: `text` attribute always is unicode.
-            itemstring_bytes = ai.text.encode(outenc)
-        # __add__ of two byte strings returns byte string with both, Py 2 and 3.
-        stdout_write_bytes(itemstring_bytes + sep_bytes)
-        action(ai)
+            strings = [item.text for item in block]
+        if isinstance(strings[0], text_type):
+            data = (sep.join(strings) + sep).encode(enc)
+        else:
+            data = sep_bytes.join(strings) + sep_bytes
+        stdout_write_bytes(data)
+        stats.bytes_written += len(data)
+
+
+def write_explanation(items, explanation):
+    """Write one line per item (in input order) to stderr: the category and
+    timecount of the bucket the item has been put into ('-' if none), 'won'
+    if the item has been accepted in that bucket ('lost' otherwise), and the
+    item string. Encode and write blocks of `OUTPUT_BLOCKSIZE` lines at once.
+    """
+    enc = sys.stdout.encoding
+    # Do not interleave with log messages written to sys.stderr.
+    sys.stderr.flush()
+    for start in range(0, len(items), OUTPUT_BLOCKSIZE):
+        lines = []
+        for i in range(start, min(start + OUTPUT_BLOCKSIZE, len(items))):
+            catlabel, timecount, won = explanation[i]
+            if catlabel is None:
+                bucket = "-"
+            elif catlabel == "recent":
+                bucket = catlabel
+            else:
+                bucket = "%s%s" % (catlabel, timecount)
+            status = "won" if won else "lost" if catlabel is not None else "-"
+            lines.append(("%-9s %-4s " % (bucket, status)).encode(enc) +
+                item_bytes(items[i], enc) + b"\n")
+        stderr_write_bytes(b"".join(lines))
+    sys.stderr.flush()
 
 
 def action(item):
-    """Perform none or one action on item.
+    """Perform none or one action on item. Count the action and log failure.
 
     Currently, this implements file system actions (delete and move).
     """
     if not isinstance(item, FileSystemEntry):
         return
+    stats.actions_attempted += 1
+    finish_action(perform_action(item))
+
+
+def finish_action(error):
+    """Count and log failure of an action, given its error message or None.
+    """
+    if error is not None:
+        stats.actions_failed += 1
+        log.error(error)
+
+
+def perform_action(item):
+    """Perform file system action (delete or move) on `item`. Return error
+    message or None if the action succeeded. Do not modify global state, so
+    that actions can be performed in worker threads.
+    """
     if options.move:
         tdir = options.move
         log.info("Moving %s to directory %s: %s", item.type, tdir, item.path)
         try:
-            shutil.move(item.path, tdir)
-        except OSError as e:
-            log.error("Cannot move '%s': %s", item.path, e)
-        return
+            move(item.path, tdir, options.move_workers)
+        except (OSError, IOError) as e:
+            return "Cannot move '%s': %s" % (item.path, e)
+        return None
     if options.delete:
         log.info("Deleting %s: %s", item.type, item.path)
         if item.type == "dir":
             if options.recursive_delete:
-                # shutil.rmtree: Delete an entire directory tree; path must
-                # point to a directory (but not a symbolic link to a directory).
+                # Delete an entire directory tree; path must point to a
+                # directory (but not a symbolic link to a directory).
+                t0 = _monotonic()
                 try:
-                    shutil.rmtree(item.path)
+                    count = remove_tree(item.path, options.delete_workers)
                 except OSError as e:
-                    log.error("Error while recursively deleting '%s': %s",
+                    return "Error while recursively deleting '%s': %s" % (
                         item.path, e)
-                return
+                log.info("Removed %s entries of '%s' in %.3f s.", count,
+                    item.path, _monotonic() - t0)
+                return None
             try:
                 # Raises OSError if dir not empty.
                 os.rmdir(item.path)
             except OSError as e:
-                log.error("Cannot rmdir '%s': %s", item.path, e)
-            return
+                return "Cannot rmdir '%s': %s" % (item.path, e)
+            return None
         elif item.type == "file":
             try:
                 os.remove(item.path)
             except OSError as e:
-                log.error("Cannot delete file '%s': %s", item.path, e)
-            return
+                return "Cannot delete file '%s': %s" % (item.path, e)
+            return None
         else:
             raise NotImplementedError
+    return None
 
 
-def read_items_from_stdin():
-    """Read items from standard input.
+def act_concurrently(items, enc, sep):
+    """Write `items` to stdout and perform their actions using a pool of
+    --action-workers threads. Items are written in order, in windows of a few
+    items per worker. Each window is flushed before its actions are
+    submitted, so that an item is never modified without having been
+    written. Failures are logged in item order. At most two windows of
+    actions are pending at any time.
+    """
+    if ThreadPoolExecutor is None:
+        err("--action-workers requires concurrent.futures (Python 3.2+ or "
+            "the futures package).")
+    workers = options.action_workers
+    window = 4 * workers
+    log.info("Perform actions using %s threads.", workers)
+    pending = []
+    with ThreadPoolExecutor(workers) as pool:
+        for start in range(0, len(items), window):
+            block = items[start:start + window]
+            write_items(block, enc, sep)
+            sys.stdout.flush()
+            stats.actions_attempted += len(block)
+            submitted = [pool.submit(perform_action, ai) for ai in block]
+            for future in pending:
+                finish_action(future.result())
+            pending = submitted
+        for future in pending:
+            finish_action(future.result())
+
+
+# Number of bytes read from stdin at once.
+STDIN_CHUNKSIZE = 1 << 20
+
+
+def read_items_from_stdin(enc=None):
+    """Read items from standard input. Decode items using codec `enc`
+    (default: sys.stdout.encoding, see `process()`).
 
     Regarding stdin decoding: http://stackoverflow.com/a/16549381/145400
     Reading a stream of chunks/records with a different separator than newline
     is not easily possible with stdlib (http://bugs.python.org/issue1152248).
-    Take simplest approach for now: read all data (processing cannot start
-    before that anyway), then split data (byte string) at sep byte occurrences
-    (NUL or newline), then decode each record and return list of unicode
-    strings.
+    Read binary data chunk by chunk until EOF, split it at sep byte occurrences
+    (NUL or newline) via `iter_records()`, then decode each non-empty record
+    and return list of unicode strings. Only one chunk of raw data is held in
+    memory at any time.
     """
-    log.debug("Read binary data from standard input, until EOF.")
+    if enc is None:
+        enc = sys.stdout.encoding
+    sep = "\0" if options.nullsep else "\n"
+    sep_bytes = sep.encode(enc)
+    log.debug("Read binary data from standard input until EOF, split on byte "
+        "separator %r, decode non-empty records using %s.", sep_bytes, enc)
+    items_unicode = []
     try:
-        bytedata = stdin_read_bytes_until_eof()
+        for nbytes, records in iter_records(stdin_read_bytes, sep_bytes):
+            stats.stdin_bytes += nbytes
+            items_unicode.extend([r.decode(enc) for r in records if r])
     except (OSError, IOError) as e:
         err("Error reading from stdin: %s" % e)
-    log.debug("%s bytes have been read.", len(bytedata))
-
-    enc = sys.stdout.encoding
-    sep = "\0" if options.nullsep else "\n"
-    sep_bytes = sep.encode(enc)
-    log.debug("Split binary stdin data on byte separator %r.", sep_bytes)
-    chunks = bytedata.split(sep_bytes)
-    log.debug("Decode non-empty chunks using %s.", enc)
-    # `split()` is the inverse of `join()`, i.e. it introduces empty strings for
-    # leading and trailing separators, and for separator sequences. That is why
-    # the `if c` part below is essential. Also see
-    # http://stackoverflow.com/a/2197493/145400
-    items_unicode = [c.decode(enc) for c in chunks if c]
+    log.debug("%s bytes have been read.", stats.stdin_bytes)
     log.debug("Identified %s item(s).", len(items_unicode))
     return items_unicode
 
 
-def prepare_input():
-    """Return a list of objects that can be categorized by `TimeFilter.filter`.
+def iter_records(read, sep, chunksize=STDIN_CHUNKSIZE):
+    """Split the binary data returned by `read(chunksize)` until EOF into
+    records (byte strings) separated by `sep`. Yield one tuple (chunk size in
+    bytes, list of records) per chunk. Records may span chunk boundaries: the
+    incomplete last record of a chunk is prepended to the next chunk.
+
+    `split()` is the inverse of `join()`, i.e. it introduces empty strings for
+    leading separators and for separator sequences. Callers must skip empty
+    records. Also see http://stackoverflow.com/a/2197493/145400
     """
+    tail = b""
+    while True:
+        chunk = read(chunksize)
+        if not chunk:
+            break
+        records = (tail + chunk).split(sep) if tail else chunk.split(sep)
+        tail = records.pop()
+        yield len(chunk), records
+    yield 0, [tail]
+
+
+def read_itemstrings():
+    """Return item strings as provided via command line or stdin."""
     if not options.stdin:
-        itemstrings = options.items
         # `itemstrings` can be either unicode or byte strings. On Unix, we
         # want to keep cmdline arguments as raw binary data as long as possible.
         # On Python 3 argv already comes in as sequence of unicode strings.
         # In file system mode on Python 2, treat items (i.e. paths) as byte
         # strings. In time-from-string mode, decode itemstrings (later).
-    else:
-        itemstrings = read_items_from_stdin()
-        # `itemstrings` as returned by `read_items_from_stdin()` are unicode.
+        return options.items
+    # Item strings as returned by `read_items_from_stdin()` are unicode.
+    return read_items_from_stdin()
+
+
+def scan_entries(top, recursive=False, mtimes=None):
+    """Return list of `os.DirEntry` objects of the entries in directory `top`,
+    sorted by name. If `recursive` is True, descend into subdirectories
+    (without following symbolic links) and return all non-directory entries.
+    Entries of unsupported type (neither file, nor directory, nor symbolic
+    link) are skipped. If `mtimes` (dict) is provided, record the mtime of
+    each scanned directory before scanning it (see `RunState.dir_mtimes()`).
+    """
+    if scandir is None:
+        err("--scan requires os.scandir() (Python 3.5+) or the scandir "
+            "package.")
+    log.info("Scan directory '%s'%s.", top, " recursively" if recursive else "")
+    entries = []
+
+    def scan(d):
+        try:
+            if mtimes is not None:
+                mtimes[RunState.dirkey(os.path.join(d, ""))] = os.stat(
+                    d).st_mtime
+            found = sorted(scandir(d), key=lambda e: e.name)
+        except OSError as e:
+            err("Cannot scan directory '%s': %s" % (d, e))
+        for entry in found:
+            if recursive and entry.is_dir(follow_symlinks=False):
+                scan(entry.path)
+            elif direntry_type(entry) is None:
+                log.info("Skip entry of unsupported type: %r", entry.path)
+            else:
+                entries.append(entry)
+
+    scan(top)
+    log.debug("Found %s entries.", len(entries))
+    return entries
+
+
+def direntry_type(entry):
+    """Return type ("dir", "file", "symlink" or None if unsupported) of
+    `os.DirEntry` `entry`, without system call on most platforms.
+    """
+    if entry.is_symlink():
+        return "symlink"
+    if entry.is_dir(follow_symlinks=False):
+        return "dir"
+    if entry.is_file(follow_symlinks=False):
+        return "file"
+    return None
+
 
+def prepare_input(itemstrings, runstate=None, entries=None):
+    """Return a list of objects that can be categorized by `TimeFilter.filter`.
+
+    If `runstate` (the `RunState` of a previous run) is provided, return the
+    accepted items of the previous run (without accessing the file system)
+    plus the items that are newer than all items of the previous run.
+
+    If `entries` (the `os.DirEntry` objects corresponding to `itemstrings`,
+    see `scan_entries()`) are provided, take type and stat result of the items
+    from there.
+    """
     if options.time_from_string is not None:
         log.info("--time-from-string set, don't interpret items as paths.")
         fmt = options.time_from_string
@@ -475,7 +876,15 @@ def prepare_input():
     log.info("Interpret items as paths.")
     log.info("Validate paths and extract modification time.")
     fses = []
-    for path in itemstrings:
+    skipped = 0
+    highwater = highwater_seconds = None
+    if runstate is not None and runstate.highwater is not None:
+        highwater = runstate.highwater
+        highwater_seconds = localtime.seconds(highwater)
+    prefetched = {}
+    if options.stat_workers > 1:
+        prefetched = prefetch_stat(itemstrings, entries, runstate)
+    for i, path in enumerate(itemstrings):
         log.debug("Type of path string: %s.", type(path))
         # On the one hand, a unicode-aware Python program should only use
         # unicode type strings internally. On the other hand, when it comes
@@ -497,6 +906,15 @@ def prepare_input():
         # http://stackoverflow.com/a/846931/145400
 
         # Definite choice for Python 2 and Unix: keep paths as byte strings.
+        previous = previous_run(path, runstate)
+        if previous == "accepted":
+            moddate, ftype = runstate.winners[RunState.key(path)]
+            log.debug("Accepted in previous run: %r", path)
+            fses.append(FileSystemEntry(path, moddate, ftype))
+            continue
+        if previous == "handled":
+            log.debug("Handled in previous run: %r", path)
+            continue
         modtime = None
         if options.time_from_basename:
             bn = os.path.basename(path)
@@ -504,26 +922,194 @@ def prepare_input():
             log.debug("Parsing modification time from basename: %r", bn)
             modtime = local_datetime_from_localtime_string(bn, fmt)
             log.debug("Modification time: %s", modtime)
+            if highwater is not None and modtime <= highwater:
+                log.debug("Not newer than previous run: %r", path)
+                skipped += 1
+                continue
         try:
-            fses.append(FileSystemEntry(path, modtime))
+            if i in prefetched:
+                statobj = prefetched[i]
+                if isinstance(statobj, OSError):
+                    log.error("stat() failed on path: '%s' (%s).", path,
+                        statobj)
+                    raise statobj
+                ftype = None if entries is None else direntry_type(entries[i])
+                fse = FileSystemEntry(path, modtime, ftype, statobj)
+            elif entries is None:
+                stats.stat_calls += 1
+                fse = FileSystemEntry(path, modtime)
+            else:
+                # DirEntry.stat() is cached, and free of charge on Windows.
+                statobj = None
+                if modtime is None:
+                    stats.stat_calls += 1
+                    statobj = entries[i].stat(follow_symlinks=False)
+                fse = FileSystemEntry(
+                    path, modtime, direntry_type(entries[i]), statobj)
         except OSError:
             err("Cannot access '%s'." % path)
+        if highwater_seconds is not None and (
+                fse.modseconds <= highwater_seconds):
+            log.debug("Not newer than previous run: %r", path)
+            skipped += 1
+            continue
+        fses.append(fse)
+    if skipped:
+        # Such items are never classified, even if they have been added to
+        # an item directory since the previous run.
+        log.info("Skipped %s item(s) not newer than the newest item of the "
+            "previous run (--state).", skipped)
     log.debug("Created %s item(s) (type: file system entry).", len(fses))
     return fses
 
 
+def previous_run(path, runstate):
+    """Return "accepted" if item `path` has been accepted in the previous run
+    (`runstate`), "handled" if it is located in a directory that has not
+    changed since, or None.
+    """
+    if runstate is None:
+        return None
+    if RunState.key(path) in runstate.winners:
+        return "accepted"
+    if RunState.dirkey(path) in runstate.unchanged_dirs:
+        return "handled"
+    return None
+
+
+def prefetch_stat(itemstrings, entries=None, runstate=None):
+    """Retrieve the stat results required by `prepare_input()` concurrently,
+    using --stat-workers threads (stat() releases the GIL). Return dict
+    mapping item index to stat result or to the `OSError` raised by stat().
+    """
+    if ThreadPoolExecutor is None:
+        err("--stat-workers requires concurrent.futures (Python 3.2+ or the "
+            "futures package).")
+    highwater = None if runstate is None else runstate.highwater
+    todo = []
+    for i, path in enumerate(itemstrings):
+        if previous_run(path, runstate) is not None:
+            continue
+        if options.time_from_basename:
+            if entries is not None:
+                # Type is known from the directory scan.
+                continue
+            if highwater is not None:
+                # Parse errors are reported by `prepare_input()`.
+                try:
+                    modtime = time_parser(options.time_from_basename).parse(
+                        os.path.basename(path))
+                except ValueError:
+                    modtime = None
+                if modtime is not None and modtime <= highwater:
+                    continue
+        todo.append(i)
+
+    def lstat(i):
+        try:
+            if entries is None:
+                return os.lstat(itemstrings[i])
+            return entries[i].stat(follow_symlinks=False)
+        except OSError as e:
+            return e
+
+    log.info("Retrieve %s stat result(s) using %s threads.", len(todo),
+        options.stat_workers)
+    with ThreadPoolExecutor(options.stat_workers) as pool:
+        results = list(pool.map(lstat, todo))
+    stats.stat_calls += len(todo)
+    return dict(zip(todo, results))
+
+
+def load_state(rules, reference_time):
+    """Read `RunState` from --state file. Return None if there is no usable
+    state, in which case all items are classified.
+    """
+    path = options.state
+    if not os.path.exists(path):
+        log.info("State file '%s' does not exist (first run).", path)
+        return None
+    try:
+        runstate = RunState.load(path)
+    except (RunStateError, IOError, OSError) as e:
+        log.error("Ignoring state file: %s", e)
+        return None
+    if (runstate.rules != rules or
+            runstate.timefmt != options.time_from_basename):
+        log.info("State file '%s' was written with different rules or "
+            "time source, ignore it.", path)
+        return None
+    if reference_time < runstate.reftime:
+        log.info("Reference time earlier than in state file '%s', ignore it.",
+            path)
+        return None
+    log.info("Using state of previous run (reference time %s, %s accepted "
+        "item(s)).", runstate.reftime.isoformat(), len(runstate.winners))
+    return runstate
+
+
+def save_state(rules, reference_time, itemstrings, items, accepted,
+        rejected, runstate, mtimes):
+    """Write `RunState` of this run to --state file. Record the directory
+    `mtimes` taken before listing the items, and the digests of the item sets.
+    Do not record directories in which `rejected` items have been deleted or
+    moved, so that the next run considers them changed. If an action has
+    failed, keep the high-water mark of the previous run and do not record
+    any directory, so that the next run classifies (and acts on) the same
+    items again.
+    """
+    newstate = RunState(rules, reference_time, options.time_from_basename)
+    if runstate is not None:
+        newstate.highwater = runstate.highwater
+    for item in accepted:
+        newstate.winners[RunState.key(item.path)] = (item.moddate, item.type)
+    if stats.actions_failed:
+        log.info("%s action(s) failed, do not advance state beyond previous "
+            "run.", stats.actions_failed)
+    else:
+        newest = max([item.modseconds for item in items] or [None])
+        if newest is not None:
+            newest = localtime.local_datetime(newest)
+            if newstate.highwater is None or newest > newstate.highwater:
+                newstate.highwater = newest
+        acted = set(RunState.dirkey(item.path) for item in rejected)
+        for d, digest in RunState.dir_digests(itemstrings).items():
+            if d in mtimes and d not in acted:
+                newstate.dirs[d] = mtimes[d]
+                newstate.digests[d] = digest
+    log.info("Write state file '%s'.", options.state)
+    try:
+        newstate.save(options.state)
+    except (IOError, OSError) as e:
+        err("Cannot write state file: %s" % e)
+
+
+# Compiled time parsers, by format string.
+_time_parsers = {}
+
+
+def time_parser(fmt):
+    """Return (cached) `TimeParser` for format string `fmt`."""
+    parser = _time_parsers.get(fmt)
+    if parser is None:
+        parser = _time_parsers[fmt] = TimeParser(fmt)
+    return parser
+
+
 def local_datetime_from_localtime_string(s, fmt):
     """Extract local time from string `s` according to format string `fmt`.
 
     Return local time as a naive datetime object (no timezone info).
     """
+    parser = time_parser(fmt)
     try:
         # Python 2.7's strptime can deal with `s` and `fmt` being byte string or
         # unicode. Python 3's strptime requires both to be unicode type. Since
         # argv is populated with unicode strings in Py 3, this requirement is
         # always fulfilled.
-        return datetime.strptime(s, fmt)
+        return parser.parse(s)
     except Exception as e:
+        stats.parse_failures += 1
         err("Error while parsing time from item string. Error: %s" % e)
 
 
@@ -550,6 +1136,62 @@ def parse_rules_from_cmdline(s):
     return rules
 
 
+class Stats(object):
+    """Durations of the program stages (measured with a monotonic clock if
+    available) and counters of a run, written to the --stats-json file.
+    """
+    counters = ("items_read", "stdin_bytes", "stat_calls", "parse_failures",
+        "actions_attempted", "actions_failed", "bytes_written")
+
+    def __init__(self):
+        for c in self.counters:
+            setattr(self, c, 0)
+        # (stage name, duration in seconds) tuples, in order of execution.
+        self.stages = []
+        self._stage = None
+        self._t0 = _monotonic()
+
+    def stage(self, name):
+        """End the current stage (if any) and start stage `name`."""
+        self.stop()
+        self._stage = name
+
+    def stop(self):
+        """End the current stage (if any)."""
+        t = _monotonic()
+        if self._stage is not None:
+            self.stages.append((self._stage, t - self._t0))
+            self._stage = None
+        self._t0 = t
+
+    def as_dict(self):
+        return {
+            "version": __version__,
+            "stages": dict(self.stages),
+            "total": sum(d for _, d in self.stages),
+            "counters": dict((c, getattr(self, c)) for c in self.counters),
+            }
+
+
+# time.monotonic() is not available on Python 2.
+_monotonic = getattr(time, "monotonic", time.time)
+
+
+# Replaced for each run, see `run()`.
+stats = Stats()
+
+
+def write_stats():
+    """Write `stats` as JSON document to --stats-json file."""
+    log.info("Write stats to '%s'.", options.stats_json)
+    try:
+        with open(options.stats_json, "wb") as f:
+            f.write(json.dumps(stats.as_dict(), indent=1,
+                sort_keys=True).encode("utf-8"))
+    except (IOError, OSError) as e:
+        log.error("Cannot write stats file: %s", e)
+
+
 def err(s):
     """Log message `s` with ERROR level and exit with code 1."""
     log.error(s)
@@ -557,8 +1199,10 @@ def err(s):
     sys.exit(1)
 
 
-def parse_options():
-    """Define and parse command line options using argparse."""
+def parse_options(argv=None):
+    """Define and parse command line options using argparse. Parse `argv`
+    (default: sys.argv[1:]).
+    """
     class ExtHelpAction(argparse.Action):
         def __call__(self, parser, namespace, values, option_string=None):
             print(EXTENDED_HELP)
@@ -598,6 +1242,20 @@ def parse_options():
             "mode. Warning: duplicate items are treated independently.")
         )
 
+    parser.add_argument("--scan", action="store", metavar="DIR",
+        help=("Use the entries of directory DIR as items. Must be used "
+            "without ITEMs and -s/--stdin.")
+        )
+    parser.add_argument("--recursive", action="store_true",
+        help=("With --scan: descend into subdirectories (without following "
+            "symbolic links) and use all entries but directories as items.")
+        )
+    parser.add_argument("--stat-workers", action="store", type=int,
+        default=1, metavar="N",
+        help=("Retrieve modification times of paths concurrently, using N "
+            "threads. Useful on file systems with high latency, such as NFS. "
+            "Default: 1.")
+        )
     parser.add_argument("-s", "--stdin", action="store_true",
         help=("Read items from stdin. The default separator is one "
             "newline character.")
@@ -644,17 +1302,53 @@ def parse_options():
 
     parser.add_argument("-r", "--recursive-delete", action="store_true",
         help="Enable deletion of non-empty directories.")
+    parser.add_argument("--delete-workers", action="store", type=int,
+        default=1, metavar="N",
+        help=("Remove the subtrees of each directory deleted via -r/"
+            "--recursive-delete in parallel, using N threads. Default: 1.")
+        )
+    parser.add_argument("--move-workers", action="store", type=int,
+        default=1, metavar="N",
+        help=("Copy the files of each directory moved via -m/--move to "
+            "another file system in parallel, using N threads. Default: 1.")
+        )
+    parser.add_argument("--action-workers", action="store", type=int,
+        default=1, metavar="N",
+        help=("Delete or move items concurrently, using N threads. Useful on "
+            "file systems with high latency, such as NFS. Items are written "
+            "to stdout in the same order as without this option. Default: 1.")
+        )
+    parser.add_argument("--explain", action="store_true",
+        help=("Write the bucket (category and timecount) of each item and "
+            "whether the item won that bucket to stderr.")
+        )
+    parser.add_argument("--state", action="store", metavar="FILE",
+        help=("Incremental mode for repeated runs over the same items: read "
+            "the state of the previous run from FILE and write the state of "
+            "this run to FILE. Requires -d/--delete or -m/--move, not allowed "
+            "in combination with -a/--accepted or --time-from-string. See "
+            "--extended-help.")
+        )
     #parser.add_argument("--follow-symlinks", action="store_true",
     #    help=("Retrieve modification time from symlink target, .. "
     #        "TODO: other implications? Not implemented yet.")
     #    )
+    parser.add_argument("--stats-json", action="store", metavar="FILE",
+        help=("Write the duration of each program stage and counters (items "
+            "read, stat() calls, actions, bytes written, ...) to FILE as JSON "
+            "document.")
+        )
+    parser.add_argument("--profile", action="store", metavar="FILE",
+        help=("Usage: --profile[=FILE]. Run under cProfile and write the "
+            "profile statistics to stderr, or to FILE in pstats format.")
+        )
     parser.add_argument('-v', '--verbose', action='count', default=0,
         help=("Control verbosity. Can be specified multiple times for "
             "increasing verbosity level. Levels: error (default), info, debug.")
         )
 
     global options
-    options = parser.parse_args()
+    options = parser.parse_args(argv)
 
 
 if WINDOWS and sys.version < '3':
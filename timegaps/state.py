@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+# Copyright 2014 Jan-Philip Gehrcke. See LICENSE file for details.
+
+
+"""timegaps.state -- persistent state for incremental timegaps runs."""
+
+
+from __future__ import unicode_literals
+import os
+import sys
+import json
+import hashlib
+import logging
+from datetime import datetime
+
+
+# Make the same code base run with Python 2 and 3.
+if sys.version < '3':
+    text_type = unicode
+    binary_type = str
+else:
+    text_type = str
+    binary_type = bytes
+
+
+log = logging.getLogger("state")
+
+
+TIMEFMT = "%Y%m%d-%H%M%S.%f"
+
+
+class RunStateError(Exception):
+    pass
+
+
+class RunState(object):
+    """Represents the outcome of a timegaps run that is relevant for the next
+    run over the same set of items: the accepted items (the bucket winners),
+    the reference time, the newest modification time of all classified items
+    (the high-water mark), and the modification times of the directories
+    containing the items as well as digests of the item sets in these
+    directories.
+
+    Public interface:
+        self.rules:     rules dictionary.
+        self.reftime:   reference time as local datetime object.
+        self.timefmt:   --time-from-basename format string or None.
+        self.highwater: newest item modification time (datetime) or None.
+        self.dirs:      dict, maps directory path to its mtime.
+        self.digests:   dict, maps directory path to the digest of the set
+                        of items located in it (see `dir_digests()`).
+        self.winners:   dict, maps item path to (moddate, type) tuple.
+        self.unchanged_dirs: set of directories found unchanged since the
+                        state has been written (populated by the user).
+
+    Paths are stored as unicode objects (see `key()`).
+    """
+    version = 2
+
+    def __init__(self, rules, reftime, timefmt=None):
+        self.rules = dict(rules)
+        self.reftime = reftime
+        self.timefmt = timefmt
+        self.highwater = None
+        self.dirs = {}
+        self.digests = {}
+        self.winners = {}
+        self.unchanged_dirs = set()
+
+    @staticmethod
+    def key(path):
+        """Return unicode representation of `path` (byte string or unicode).
+        """
+        if isinstance(path, binary_type):
+            return path.decode(sys.getfilesystemencoding())
+        return path
+
+    @classmethod
+    def dirkey(cls, path):
+        """Return unicode representation of the parent directory of `path`.
+        """
+        return cls.key(os.path.dirname(path)) or "."
+
+    @classmethod
+    def dir_mtimes(cls, paths):
+        """Return dict mapping the parent directories of `paths` to their
+        current mtime. Directories that cannot be accessed are omitted.
+        """
+        mtimes = {}
+        for path in paths:
+            d = cls.dirkey(path)
+            if d in mtimes:
+                continue
+            try:
+                mtimes[d] = os.stat(d).st_mtime
+            except OSError as e:
+                log.debug("Cannot stat directory '%s': %s", d, e)
+        return mtimes
+
+    @classmethod
+    def dir_digests(cls, paths):
+        """Return dict mapping the parent directories of `paths` to a digest
+        (hex string) of the set of item names in `paths` located in them.
+        """
+        names = {}
+        for path in paths:
+            names.setdefault(cls.dirkey(path), set()).add(
+                cls.key(os.path.basename(path)))
+        # JSON escapes non-ASCII characters (and lone surrogates).
+        return dict((d, hashlib.sha1(
+            json.dumps(sorted(n)).encode("ascii")).hexdigest())
+            for d, n in names.items())
+
+    @classmethod
+    def load(cls, path):
+        """Read state from JSON file `path`. Raise `RunStateError` if the file
+        content is not a valid state document.
+        """
+        with open(path, "rb") as f:
+            data = f.read()
+        try:
+            doc = json.loads(data.decode("utf-8"))
+            if doc["version"] != cls.version:
+                raise RunStateError(
+                    "Unsupported state version: %s" % doc["version"])
+            state = cls(
+                rules=doc["rules"],
+                reftime=datetime.strptime(doc["reftime"], TIMEFMT),
+                timefmt=doc["timefmt"])
+            if doc["highwater"] is not None:
+                state.highwater = datetime.strptime(doc["highwater"], TIMEFMT)
+            state.dirs = dict(doc["dirs"])
+            state.digests = dict(doc["digests"])
+            for p, moddate, ftype in doc["winners"]:
+                state.winners[p] = (datetime.strptime(moddate, TIMEFMT), ftype)
+        except (ValueError, KeyError, TypeError) as e:
+            raise RunStateError("Invalid state file '%s': %s" % (path, e))
+        return state
+
+    def save(self, path):
+        """Write state to JSON file `path`. Write to a temporary file first
+        and rename it, so that an interrupted run never leaves a partially
+        written state file behind.
+        """
+        doc = {
+            "version": self.version,
+            "rules": self.rules,
+            "reftime": self.reftime.strftime(TIMEFMT),
+            "timefmt": self.timefmt,
+            "highwater": (None if self.highwater is None else
+                self.highwater.strftime(TIMEFMT)),
+            "dirs": self.dirs,
+            "digests": self.digests,
+            "winners": sorted([p, moddate.strftime(TIMEFMT), ftype]
+                for p, (moddate, ftype) in self.winners.items()),
+            }
+        tmppath = "%s.tmp" % path
+        with open(tmppath, "wb") as f:
+            f.write(json.dumps(doc, indent=1, sort_keys=True).encode("utf-8"))
+        if sys.platform == "win32" and os.path.exists(path):
+            # os.rename() does not replace existing files on Windows.
+            os.remove(path)
+        os.rename(tmppath, path)
@@ -31,3 +31,56 @@ def months(t1, t2):
 def years(t1, t2):
     return t2.year - t1.year
 
+
+# Integer arithmetic companion API. A datetime is mapped once to its calendar
+# unit indices; the difference between two datetimes in a certain granularity
+# then simply is the difference of the corresponding indices. Results are
+# identical to the ones of the functions above.
+
+
+def indices(t):
+    """Return tuple of (hour, day, week, month, year) indices of datetime `t`,
+    counted from 0001-01-01 (proleptic Gregorian ordinal 1, a Monday). Weeks
+    start on Monday.
+    """
+    d = t.toordinal()
+    return d * 24 + t.hour, d, (d - 1) // 7, t.year * 12 + t.month, t.year
+
+
+def diffs(t, refindices):
+    """Return tuple of (hours, days, weeks, months, years) differences between
+    datetime `t` and the reference time whose `indices()` are `refindices`.
+    """
+    rh, rd, rw, rm, ry = refindices
+    h, d, w, m, y = indices(t)
+    return rh - h, rd - d, rw - w, rm - m, ry - y
+
+
+def period_starts(unit, t, n):
+    """Return the start times of the calendar period of `unit` ("hours",
+    "days", "weeks", "months" or "years") containing datetime `t` and of the
+    `n` preceding periods, newest first. An item with modification time `m` is
+    k units older than `t` if `starts[k] <= m < starts[k-1]`. Periods starting
+    before `datetime.min` are omitted.
+    """
+    if unit in ("months", "years"):
+        if unit == "years":
+            step, first = 12, t.year * 12
+        else:
+            step, first = 1, t.year * 12 + t.month - 1
+        # Month index 12 is January of year 1.
+        n = min(n, (first - 12) // step)
+        return [datetime.datetime((first - k * step) // 12,
+            (first - k * step) % 12 + 1, 1) for k in range(n + 1)]
+    start = datetime.datetime.combine(t.date(), datetime.time(
+        t.hour if unit == "hours" else 0))
+    if unit == "hours":
+        step = datetime.timedelta(hours=1)
+    elif unit == "days":
+        step = datetime.timedelta(days=1)
+    else:
+        step = datetime.timedelta(days=7)
+        start -= datetime.timedelta(days=t.weekday())
+    n = min(n, int((start - datetime.datetime.min).total_seconds() //
+        step.total_seconds()))
+    return [start - k * step for k in range(n + 1)]
@@ -8,11 +8,37 @@ timegaps.timefilter -- generic time categorization logic as used by timegaps.
 
 
 from __future__ import unicode_literals
+import sys
 import datetime
 import logging
-from collections import defaultdict
+import heapq
+from bisect import bisect_left, bisect_right
+from array import array
 from collections import OrderedDict
+from itertools import compress, chain
 from . import timediff
+from . import localtime
+
+# NumPy is optional: it is only required by `TimeFilter.filter_array()`.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Only required for `TimeFilter.filter(..., workers=N)`. Not part of the
+# Python 2 standard library, but available as a package (futures).
+try:
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:
+    ProcessPoolExecutor = None
+
+# Choosing the start method of the worker processes requires
+# `multiprocessing.get_context()` (Python 3.4+) and the `mp_context` argument
+# of `ProcessPoolExecutor` (Python 3.7+).
+_MP_CONTEXT = (ProcessPoolExecutor is not None and
+    getattr(multiprocessing, "get_context", None) is not None and
+    sys.version_info >= (3, 7))
 
 log = logging.getLogger("timefilter")
 
@@ -70,85 +96,106 @@ class TimeFilter(object):
                 self.rules[label] = defaultcount
         log.debug("TimeFilter set up with reftime %s and rules %s",
             self.reftime, self.rules)
+        self._build_plan()
+
+    def _build_plan(self):
+        """Precompute the category-timecount buckets for the reference time.
+
+        All buckets are numbered consecutively (bucket id). For each category
+        with a count > 0, `self._plan` contains a tuple `(catlabel, bounds,
+        offset, n)`: `bounds` is the ascending list of the start times of the
+        `n` buckets of this category and of the current (0) period. For a
+        modification time `t`, `p = bisect_right(bounds, t)` yields the bucket
+        with timecount `n + 1 - p` and id `offset + p - 1` if `0 < p <= n`.
+        Otherwise, `t` is either older than the oldest bucket (p == 0) or in
+        the current period (p == n + 1).
+
+        `self._plan` is sorted by the start time of the oldest bucket of each
+        category (its horizon), oldest first. An item older than the horizon
+        of a category is older than the horizons of all following categories,
+        too, so that the lookup can stop there. An item older than
+        `self._horizon` does not populate any bucket.
+        """
+        self._plan = []
+        self._nbuckets = 0
+        # Everything younger than the start of the current hour is 'recent'.
+        self._recentstart = timediff.period_starts("hours", self.reftime, 0)[0]
+        for catlabel in ("hours", "days", "weeks", "months", "years"):
+            if self.rules[catlabel] == 0:
+                continue
+            bounds = timediff.period_starts(
+                catlabel, self.reftime, self.rules[catlabel])
+            bounds.reverse()
+            # Buckets before datetime.min have been omitted.
+            n = len(bounds) - 1
+            self._plan.append((catlabel, bounds, self._nbuckets, n))
+            self._nbuckets += n
+        self._plan.sort(key=lambda entry: entry[1][0])
+        self._horizon = self._plan[0][1][0] if self._plan else self._recentstart
+        # Items older than the oldest hour bucket populate the same buckets
+        # within a whole day.
+        self._daily_before = datetime.datetime.max
+        for catlabel, bounds, _, _ in self._plan:
+            if catlabel == "hours":
+                self._daily_before = bounds[0]
+        # The above for `_summarize()`: as datetime objects and in local
+        # seconds (see `localtime`).
+        self._unscaled = (self.reftime, self._recentstart, self._horizon,
+            self._daily_before,
+            [(bounds, offset, n) for _, bounds, offset, n in self._plan])
+        self._scaled = (
+            localtime.seconds(self.reftime),
+            localtime.seconds(self._recentstart),
+            localtime.seconds(self._horizon),
+            float("inf") if self._daily_before == datetime.datetime.max else
+                localtime.seconds(self._daily_before),
+            [([localtime.seconds(b) for b in bounds], offset, n)
+                for _, bounds, offset, n in self._plan])
 
-    def filter(self, objs):
+    def filter(self, objs, presorted=False, workers=None, explain=False):
         """Split list of objects into two lists, `accepted` and `rejected`,
         according to the rules. A treatable object is required to have a
         `modtime` attribute, carrying a Unix timestamp.
-        """
-        # Upon categorization, items are put into category-timecount buckets,
-        # for instance into the 2-year bucket (category: year, timecount: 2).
-        # Each bucket may contain multiple items. Therefore, each category
-        # (years, months, etc) is represented as a dictionary, whereas the
-        # buckets are represented as lists. The timecount for a certain bucket
-        # is used as a key for storing the list (value) in the dictionary.
-        # For example, `self._years_dict[2]` stores the list representing the
-        # 2-year bucket. These dictionaries and their key-value-pairs are
-        # created on the fly.
-        #
-        # There is no timecount distinction in 'recent' category, therefore
-        # only one list is used for storing recent items.
 
-        for catlabel in list(self.rules.keys())[:-1]:
-            setattr(self, "_%s_dict" % catlabel, defaultdict(list))
-        self._recent_items = []
+        If `presorted` is True, `objs` must be sorted by modification time
+        (oldest first), which allows for classifying them in a single linear
+        sweep. Raise `TimeFilterError` if they turn out not to be sorted.
+
+        If `workers` is > 1, split `objs` into that many shards and classify
+        them in parallel in a pool of worker processes. Where that is not
+        supported (see `_summarize_parallel()`), log a warning and classify
+        them in this process.
+
+        If `explain` is True, record the bucket of each object and whether it
+        won that bucket in `self.explanation` (an `Explanation`).
+        """
+        if presorted and workers is not None:
+            raise TimeFilterError("`presorted` and `workers` are exclusive.")
 
         # ensure we can iterate over objs twice even if it's an iterator
         objs = list(objs)
 
+        if presorted:
+            accepted, rejected = self._filter_presorted(objs)
+            if explain:
+                self.explanation = self._explain(objs)
+            return accepted, rejected
+
         # Categorize given objects.
-        for obj in objs:
-            # Might raise AttributeError if `obj` does not have `moddate`
-            # attribute or other exceptions upon `_Timedelta` creation.
-            try:
-                td = _Timedelta(obj.moddate, self.reftime)
-            except _TimedeltaError as e:
-                raise TimeFilterError("Cannot categorize %s: %s" % (obj, e))
-            # If timecount in youngest category after 'recent' is 0, then this
-            # is a recent item.
-            if td.hours == 0:
-                if self.rules["recent"] > 0:
-                    self._recent_items.append(obj)
-                continue
-            # Iterate through all categories from young to old, w/o 'recent'.
-            # Sign. performance impact, don't go with self.rules.keys()[-2::-1]
-            for catlabel in ("hours", "days", "weeks", "months", "years"):
-                timecount = getattr(td, catlabel)
-                if 0 < timecount <= self.rules[catlabel]:
-                    # `obj` is X hours/days/weeks/months/years old with X >= 1.
-                    # X is requested in current category, e.g. when 3 days are
-                    # requested (`self.rules[catlabel]` == 3), and category is
-                    # days and X is 2, then X <= 3, so put `obj` into
-                    # self._days_dict` with timecount (2) key.
-                    #log.debug("Put %s into %s/%s.", obj, catlabel, timecount)
-                    getattr(self, "_%s_dict" % catlabel)[timecount].append(obj)
-
-        accepted_objs = set()
-
-        # Sort all category-timecount buckets internally and filter them:
-        # Accept the newest element from each bucket.
-        # The 'recent' items list needs special treatment. Sort, accept the
-        # newest N elements.
-        self._recent_items.sort(key=lambda f: f.moddate)
-        for recent_item in self._recent_items[-self.rules["recent"]:]:
-            accepted_objs.add(recent_item)
-            # log.debug(
-            #    "Accepted %s: %s/%s",
-            #    recent_item, "recent", "?")
-        # Iterate through all other categories except for 'recent'.
-        # `catdict[timecount]` occurrences are lists with at least one item.
-        # The newest item in each of these category-timecount buckets is to
-        # be accepted.
-        for catlabel in list(self.rules.keys())[:-1]:
-            catdict = getattr(self, "_%s_dict" % catlabel)
-            for timecount in catdict:
-                catdict[timecount].sort(key=lambda f: f.moddate)
-                # already_accepted = catdict[timecount][-1] in accepted_objs
-                accepted_objs.add(catdict[timecount][-1])
-                # log.debug(
-                #    "Accepted %s: %s/%s.%s",
-                #    catdict[timecount][-1], catlabel, timecount,
-                #    "(already accepted)" if already_accepted else "")
+        try:
+            if workers is not None and workers > 1:
+                winners, recent = self._summarize_parallel(objs, workers)
+            else:
+                moddates, seconds = _moddates(objs)
+                winners, recent = self._summarize(moddates, seconds=seconds)
+        except _FutureItem as e:
+            obj = objs[e.index]
+            raise _future_error(obj, obj.moddate, self.reftime)
+        if explain:
+            self.explanation = self._explain(objs, (winners, recent))
+
+        accepted_objs = set(objs[w[1]] for w in winners if w is not None)
+        accepted_objs.update(objs[i] for _, i in recent)
 
         # calculate the difference of objs and accepted_objs using list
         # comprehension instead of set.difference() -- it's deterministic (it
@@ -157,6 +204,589 @@ class TimeFilter(object):
         rejected_objs = [obj for obj in objs if obj not in accepted_objs]
         return sorted(accepted_objs, key=lambda f: f.moddate), rejected_objs
 
+    def _summarize(self, moddates, offset=0, seconds=False):
+        """Categorize the items with modification times `moddates` (an
+        iterable) and indices `offset`, `offset + 1`, ... Return a summary
+        tuple `(winners, recent)`: `winners` is a list indexed by bucket id,
+        containing a `(moddate, index)` tuple for the newest item of each
+        bucket (None for empty buckets). `recent` is a list of `(moddate,
+        index)` tuples of the newest N recent items. Summaries of disjoint sets
+        of items can be combined with `_merge_summaries()`.
+
+        If `seconds` is True, `moddates` are local seconds (see `localtime`)
+        instead of datetime objects.
+
+        Raise `_FutureItem` for an item later than the reference time.
+        """
+        # Upon categorization, items are put into category-timecount buckets,
+        # for instance into the 2-year bucket (category: year, timecount: 2).
+        # Only the newest item of each bucket is accepted, so for each bucket
+        # only the newest item seen so far (and its modification time) is
+        # kept track of. All buckets are stored in flat lists, indexed by
+        # bucket id (see `_build_plan()`). Of multiple items with the same
+        # modification time the last one wins (as if the bucket was sorted
+        # stably and its last item was taken).
+        #
+        # There is no timecount distinction in 'recent' category. The newest N
+        # recent items are kept track of in a min-heap of (moddate, index)
+        # tuples with at most N elements.
+        winners = [None] * self._nbuckets
+        recent_heap = []
+
+        maxrecent = self.rules["recent"]
+        if seconds:
+            winnertimes = [float("-inf")] * self._nbuckets
+            reftime, recentstart, horizon, daily_before, plan = self._scaled
+        else:
+            winnertimes = [datetime.datetime.min] * self._nbuckets
+            reftime, recentstart, horizon, daily_before, plan = self._unscaled
+        # Maps hour or day to the ids of the buckets populated by items within
+        # that hour or day.
+        cache = {}
+        classified = misses = 0
+        for i, t in enumerate(moddates, offset):
+            if t > reftime:
+                raise _FutureItem(i, t)
+            # If timecount in youngest category after 'recent' is 0, then this
+            # is a recent item.
+            if t >= recentstart:
+                if maxrecent > 0:
+                    if len(recent_heap) < maxrecent:
+                        heapq.heappush(recent_heap, (t, i))
+                    else:
+                        heapq.heappushpop(recent_heap, (t, i))
+                continue
+            # Items older than all buckets are rejected right away.
+            if t < horizon:
+                continue
+            # All bucket bounds are hour boundaries, so that all items within
+            # the same hour populate the same buckets: look them up once per
+            # hour. Bounds older than the oldest hour bucket are day
+            # boundaries: look them up once per day for older items. The key
+            # is the hour (for days: the first hour of the day) since an
+            # arbitrary epoch. Day and hour keys cannot collide: an hour
+            # bucket never starts before midnight of the same day.
+            if seconds:
+                if t < daily_before:
+                    key = t // 86400 * 24
+                else:
+                    key = t // 3600
+            else:
+                key = t.toordinal() * 24
+                if t >= daily_before:
+                    key += t.hour
+            bucketids = cache.get(key)
+            if bucketids is None:
+                bucketids = cache[key] = _bucketids(t, plan)
+                misses += 1
+            for bucketid in bucketids:
+                if t >= winnertimes[bucketid]:
+                    winnertimes[bucketid] = t
+                    winners[bucketid] = i
+            classified += 1
+
+        if classified:
+            log.debug("Bucket lookup cache: %s of %s lookups cached (%.1f %%).",
+                classified - misses, classified,
+                100.0 * (classified - misses) / classified)
+        return [None if w is None else (t, w)
+            for t, w in zip(winnertimes, winners)], recent_heap
+
+    def _explain(self, objs, summary=None):
+        """Return `Explanation` for `objs`, given their summary (cf.
+        `_summarize()`), which is computed if not provided.
+        """
+        moddates, seconds = _moddates(objs)
+        if summary is None:
+            summary = self._summarize(moddates, seconds=seconds)
+        winners, recent = summary
+        _, recentstart, horizon, _, plan = (
+            self._scaled if seconds else self._unscaled)
+
+        # Category (index into `valid_categories`) and timecount by bucket id.
+        bucketcats = [None] * self._nbuckets
+        buckettimecounts = [None] * self._nbuckets
+        for catlabel, _, offset, n in self._plan:
+            bucketcats[offset:offset + n] = (
+                [self.valid_categories.index(catlabel)] * n)
+            buckettimecounts[offset:offset + n] = range(n, 0, -1)
+        winnerof = [-1 if w is None else w[1] for w in winners]
+        recentwinners = set(i for _, i in recent)
+        recentcat = self.valid_categories.index("recent")
+
+        explanation = Explanation()
+        category = explanation.category
+        timecount = explanation.timecount
+        won = explanation.won
+        for i, t in enumerate(moddates):
+            if t >= recentstart:
+                category.append(recentcat)
+                timecount.append(0)
+                won.append(i in recentwinners)
+                continue
+            bucketids = () if t < horizon else _bucketids(t, plan)
+            # Of multiple buckets, report the youngest category bucket the item
+            # won, if any.
+            wonids = [b for b in bucketids if winnerof[b] == i]
+            bucketids = wonids or bucketids
+            if not bucketids:
+                category.append(-1)
+                timecount.append(0)
+                won.append(False)
+                continue
+            b = max(bucketids, key=bucketcats.__getitem__)
+            category.append(bucketcats[b])
+            timecount.append(buckettimecounts[b])
+            won.append(bool(wonids))
+        return explanation
+
+    def _summarize_parallel(self, objs, workers):
+        """Split `objs` into `workers` shards, summarize each shard in a
+        worker process and return the merged summary (cf. `_summarize()`).
+
+        Where available (POSIX), worker processes are forked and read their
+        shard from `objs`, handed to them by the pool initializer (inherited,
+        not copied). Otherwise, the modification times of each shard are sent
+        to the worker. Only the small summaries (bucket winners and recent
+        items, as moddate and index into `objs`) are sent back to this
+        process. If concurrent.futures is not available or the start method
+        of worker processes cannot be chosen (Python < 3.7), summarize `objs`
+        in this process.
+        """
+        if not _MP_CONTEXT:
+            log.warning("Parallel filtering requires Python 3.7+ and "
+                "concurrent.futures, classify items in this process.")
+            moddates, seconds = _moddates(objs)
+            return self._summarize(moddates, seconds=seconds)
+        try:
+            context = multiprocessing.get_context("fork")
+            initializer, initargs = _share_objs, (objs,)
+        except ValueError:
+            context = None
+            initializer, initargs = None, ()
+        shardsize = -(-len(objs) // workers) or 1
+        shards = [(start, min(start + shardsize, len(objs)))
+            for start in range(0, len(objs), shardsize)]
+        log.debug("Classify %s item(s) in %s shard(s).", len(objs), len(shards))
+        with ProcessPoolExecutor(workers, mp_context=context,
+                initializer=initializer, initargs=initargs) as pool:
+            futures = [pool.submit(_summarize_shard, dict(self.rules),
+                self.reftime, start, stop,
+                None if context else _moddates(objs[start:stop]))
+                for start, stop in shards]
+            results = [f.result() for f in futures]
+        if len(set(seconds for _, seconds in results)) > 1:
+            # Only some objects provide local seconds, compare datetimes.
+            moddates, seconds = _moddates(objs)
+            return self._summarize(moddates, seconds=seconds)
+        return _merge_summaries([summary for summary, _ in results],
+            self.rules["recent"])
+
+    def _filter_presorted(self, objs):
+        """Implement `filter` for a list of objects sorted by modification
+        time. Consecutive objects populate the same set of buckets until a
+        bucket boundary is crossed. The last object before a boundary is the
+        newest one in each of these buckets. So, only at boundaries the
+        buckets need to be looked up. Otherwise, the effort per object is two
+        comparisons. Objects are accepted based on their position in `objs`.
+        """
+        plan = [(bounds, offset, n) for _, bounds, offset, n in self._plan]
+        recentstart = self._recentstart
+        # Index of the newest object in each bucket (-1: empty).
+        winners = [-1] * self._nbuckets
+        # Bucket ids populated by the objects in the current segment between
+        # two boundaries, and the start of the next segment.
+        current = []
+        nextchange = previous = datetime.datetime.min
+        firstrecent = len(objs)
+        for i, obj in enumerate(objs):
+            t = obj.moddate
+            if t < nextchange:
+                if t < previous:
+                    raise TimeFilterError(("Items not sorted by modification "
+                        "time: %s is older than its predecessor.") % obj)
+                previous = t
+                continue
+            previous = t
+            # Boundary crossed: the previous object is the newest one in all
+            # buckets of the previous segment.
+            for bucketid in current:
+                winners[bucketid] = i - 1
+            if t >= recentstart:
+                # All remaining objects are 'recent' (or in the future).
+                firstrecent = i
+                break
+            current = []
+            nextchange = recentstart
+            for bounds, offset, n in plan:
+                p = bisect_right(bounds, t)
+                if 0 < p <= n:
+                    current.append(offset + p - 1)
+                if p <= n and bounds[p] < nextchange:
+                    nextchange = bounds[p]
+        else:
+            for bucketid in current:
+                winners[bucketid] = len(objs) - 1
+
+        # Validate the 'recent' objects. Accept the newest N of them.
+        for i in range(firstrecent, len(objs)):
+            t = objs[i].moddate
+            if t < previous:
+                raise TimeFilterError(("Items not sorted by modification "
+                    "time: %s is older than its predecessor.") % objs[i])
+            previous = t
+        if objs and objs[-1].moddate > self.reftime:
+            raise _future_error(objs[-1], objs[-1].moddate, self.reftime)
+        accepted = bytearray(len(objs))
+        if self.rules["recent"] > 0:
+            for i in range(max(firstrecent, len(objs) - self.rules["recent"]),
+                    len(objs)):
+                accepted[i] = 1
+        for i in winners:
+            if i >= 0:
+                accepted[i] = 1
+        rejected = accepted.translate(_INVERT)
+        return list(compress(objs, accepted)), list(compress(objs, rejected))
+
+    def filter_reftimes(self, objs, reftimes):
+        """Apply the rules for each reference time in `reftimes` (instead of
+        `self.reftime`) to the list of objects `objs`. Return a list with one
+        `(accepted, rejected)` tuple per reference time, each as returned by
+        `filter` for that reference time.
+
+        The objects are sorted once. For each reference time, the newest
+        object in each category-timecount bucket is then looked up via
+        bisection, so that the per-reference-time effort scales with the
+        number of buckets rather than with the number of objects (except for
+        building the rejected list).
+        """
+        objs = list(objs)
+        # Stable sort: of multiple objects with the same modification time,
+        # the last one in input order is considered the newest, as in `filter`.
+        items = sorted(objs, key=lambda f: f.moddate)
+        moddates = [f.moddate for f in items]
+        results = []
+        for reftime in reftimes:
+            if moddates and moddates[-1] > reftime:
+                raise _future_error(items[-1], moddates[-1], reftime)
+            # Indices into `items` of the accepted objects.
+            winners = set()
+            # Objects younger than 1 hour are 'recent' and are not put into
+            # any other category.
+            firstrecent = bisect_left(
+                moddates, timediff.period_starts("hours", reftime, 0)[0])
+            if self.rules["recent"] > 0:
+                winners.update(range(
+                    max(firstrecent, len(items) - self.rules["recent"]),
+                    len(items)))
+            for catlabel in ("hours", "days", "weeks", "months", "years"):
+                if self.rules[catlabel] == 0:
+                    continue
+                starts = timediff.period_starts(
+                    catlabel, reftime, self.rules[catlabel])
+                # The newest object in bucket k is the last one before the
+                # start of bucket k-1, if it is not older than the start of
+                # bucket k.
+                for k in range(1, len(starts)):
+                    i = bisect_left(moddates, starts[k - 1], 0, firstrecent) - 1
+                    if i >= 0 and moddates[i] >= starts[k]:
+                        winners.add(i)
+            accepted = [items[i] for i in sorted(winners)]
+            accepted_set = set(accepted)
+            rejected = [obj for obj in objs if obj not in accepted_set]
+            results.append((accepted, rejected))
+        return results
+
+    def filter_stream(self, objs):
+        """Generator variant of `filter`, consuming `objs` (any iterable) once
+        and yielding `(obj, accepted)` tuples.
+
+        A rejected object is yielded (with `accepted` being False) as soon as
+        it is known to be rejected, i.e. when it is displaced by a newer object
+        from all category-timecount buckets it has populated. After `objs` has
+        been exhausted, the accepted objects are yielded in order of their
+        modification time. The order of rejected objects differs from the one
+        returned by `filter`. Memory consumption is proportional to the sum
+        of the rule counts, not to the number of objects.
+        """
+        maxrecent = self.rules["recent"]
+        # Current candidate for each (category, timecount) bucket, and the
+        # newest `maxrecent` recent items (min-heap). Candidates are stored as
+        # (moddate, seq, obj) tuples, where `seq` is the input position of
+        # `obj`. For equal modification times, the later item wins, like the
+        # last item of a stably sorted bucket in `filter`.
+        candidates = [None] * self._nbuckets
+        recent_heap = []
+        # Number of buckets (including the recent heap) each candidate
+        # currently populates, keyed by `seq`.
+        refcounts = {}
+
+        def release(candidate):
+            # `candidate` has been displaced from one bucket. It is rejected
+            # if it does not populate any other bucket.
+            seq = candidate[1]
+            refcounts[seq] -= 1
+            if refcounts[seq] == 0:
+                del refcounts[seq]
+                return True
+            return False
+
+        reftime = self.reftime
+        recentstart = self._recentstart
+        plan = [(bounds, offset, n) for _, bounds, offset, n in self._plan]
+        for seq, obj in enumerate(objs):
+            moddate = obj.moddate
+            if moddate > reftime:
+                raise _future_error(obj, moddate, reftime)
+            entry = (moddate, seq, obj)
+            if moddate >= recentstart:
+                if maxrecent == 0:
+                    yield obj, False
+                elif len(recent_heap) < maxrecent:
+                    heapq.heappush(recent_heap, entry)
+                    refcounts[seq] = 1
+                else:
+                    # Pushes `entry`, pops (and returns) the oldest entry,
+                    # which may be `entry` itself.
+                    oldest = heapq.heappushpop(recent_heap, entry)
+                    if oldest is entry:
+                        yield obj, False
+                        continue
+                    refcounts[seq] = 1
+                    if release(oldest):
+                        yield oldest[2], False
+                continue
+            populated = 0
+            displaced = []
+            for bounds, offset, n in plan:
+                if moddate < bounds[0]:
+                    break
+                p = bisect_right(bounds, moddate)
+                if p <= n:
+                    bucketid = offset + p - 1
+                    current = candidates[bucketid]
+                    if current is not None and moddate < current[0]:
+                        continue
+                    candidates[bucketid] = entry
+                    populated += 1
+                    if current is not None:
+                        displaced.append(current)
+            if not populated:
+                yield obj, False
+                continue
+            refcounts[seq] = populated
+            for current in displaced:
+                if release(current):
+                    yield current[2], False
+
+        accepted = dict((e[1], e) for e in candidates if e is not None)
+        accepted.update((e[1], e) for e in recent_heap)
+        for _, _, obj in sorted(accepted.values(), key=lambda e: e[:2]):
+            yield obj, True
+
+    def filter_array(self, moddates):
+        """Vectorized variant of `filter` operating on a NumPy array of
+        modification times instead of on a sequence of objects. Requires NumPy.
+
+        `moddates` must be a one-dimensional array of `datetime64` values (any
+        unit) representing local time, or an array of integers which are then
+        interpreted as `datetime64[s]` values (seconds since 1970-01-01 00:00,
+        local time).
+
+        Return two integer arrays, `accepted` and `rejected`, containing
+        indices into `moddates`. The result is identical to the one of
+        `filter`: `accepted` is sorted by modification time, `rejected` keeps
+        the original order.
+        """
+        if numpy is None:
+            raise TimeFilterError("filter_array() requires NumPy.")
+        t = numpy.asarray(moddates)
+        if t.ndim != 1:
+            raise TimeFilterError("Modification time array must be 1D.")
+        if t.dtype.kind in "iu":
+            t = t.astype("datetime64[s]")
+        elif t.dtype.kind != "M":
+            raise TimeFilterError(
+                "Unsupported modification time array type: %s" % t.dtype)
+        if numpy.isnat(t).any():
+            raise TimeFilterError("Modification time array contains NaT.")
+        ref = numpy.array(self.reftime, dtype="datetime64[us]")
+        future = numpy.flatnonzero(t > ref)
+        if future.size:
+            raise TimeFilterError(("Cannot categorize item %s: Modification "
+                "time %s not earlier than reference time %s.") % (
+                future[0], t[future[0]], self.reftime))
+
+        def index(a, unit):
+            # Casting datetime64 values to a coarser unit floors them (also
+            # before 1970), i.e. truncates to the start of the calendar unit.
+            return a.astype("datetime64[%s]" % unit).view("int64")
+
+        def count(unit):
+            # Calendar difference in units of `unit`, cf. `timediff`.
+            return index(ref, unit) - index(t, unit)
+
+        # Sort keys: modification times as integers in their native unit.
+        tkeys = t.view("int64")
+        accepted = numpy.zeros(t.shape, dtype=bool)
+        counts = {
+            "hours": count("h"),
+            "days": count("D"),
+            # 1970-01-01 was a Thursday. Shift day numbers by 3 for counting
+            # weeks starting on Monday, like `timediff.weeks()`.
+            "weeks": (index(ref, "D") + 3) // 7 - (index(t, "D") + 3) // 7,
+            "months": count("M"),
+            "years": count("Y"),
+            }
+
+        # Accept the newest N 'recent' items. Sort stably, so that items with
+        # equal modification time are ranked by input order, as in `filter`.
+        if self.rules["recent"] > 0:
+            idx = numpy.flatnonzero(counts["hours"] == 0)
+            idx = idx[numpy.argsort(tkeys[idx], kind="stable")]
+            accepted[idx[-self.rules["recent"]:]] = True
+
+        # In each category, sort candidates by (timecount, modification time,
+        # index) and accept the last item in each timecount group.
+        for catlabel in ("hours", "days", "weeks", "months", "years"):
+            maxcount = self.rules[catlabel]
+            if maxcount == 0:
+                continue
+            c = counts[catlabel]
+            idx = numpy.flatnonzero((c > 0) & (c <= maxcount))
+            if not idx.size:
+                continue
+            idx = idx[numpy.lexsort((tkeys[idx], c[idx]))]
+            c = c[idx]
+            groupend = numpy.ones(idx.shape, dtype=bool)
+            groupend[:-1] = c[1:] != c[:-1]
+            accepted[idx[groupend]] = True
+
+        accepted_idx = numpy.flatnonzero(accepted)
+        accepted_idx = accepted_idx[
+            numpy.argsort(tkeys[accepted_idx], kind="stable")]
+        return accepted_idx, numpy.flatnonzero(~accepted)
+
+
+class Explanation(object):
+    """Per-object outcome of `TimeFilter.filter(..., explain=True)` in input
+    order, stored in three `array` columns instead of per-object containers:
+
+        self.category:  index into `TimeFilter.valid_categories` of the bucket
+                        category, or -1 if the object is not in any bucket.
+        self.timecount: timecount of the bucket (0 for 'recent').
+        self.won:       1 if the object won (has been accepted in) the bucket.
+
+    An object may be in buckets of multiple categories. Of these, the bucket
+    won by the object, if any, with the youngest category is recorded.
+    """
+    def __init__(self):
+        # Python 2's array() requires a byte string type code.
+        self.category = array(str("b"))
+        self.timecount = array(str("l"))
+        self.won = array(str("b"))
+
+    def __len__(self):
+        return len(self.category)
+
+    def __getitem__(self, i):
+        """Return `(catlabel, timecount, won)` tuple for object `i`. `catlabel`
+        is None if the object is not in any bucket.
+        """
+        c = self.category[i]
+        catlabel = TimeFilter.valid_categories[c] if c >= 0 else None
+        return catlabel, self.timecount[i], bool(self.won[i])
+
+
+def _moddates(objs):
+    """Return tuple `(moddates, seconds)`: the list of the modification times
+    of `objs`, in local seconds if all objects provide them (like
+    `FileSystemEntry`, `seconds` is True), otherwise as datetime objects.
+    """
+    try:
+        return [obj.modseconds for obj in objs], True
+    except AttributeError:
+        return [obj.moddate for obj in objs], False
+
+
+# Objects to be summarized by a forked worker process, set by the pool
+# initializer in the worker process only (see
+# `TimeFilter._summarize_parallel()`).
+_shared_objs = None
+
+
+def _share_objs(objs):
+    """Make `objs` available to `_summarize_shard()` in this process."""
+    global _shared_objs
+    _shared_objs = objs
+
+
+def _summarize_shard(rules, reftime, start, stop, moddates=None):
+    """Summarize items `start` to `stop` in a worker process. Return tuple
+    `(summary, seconds)`, cf. `_moddates()`. `moddates` is the return value
+    of `_moddates()` for these items. If it is not provided, read the items
+    from `_shared_objs`.
+    """
+    if moddates is None:
+        moddates = _moddates(_shared_objs[start:stop])
+    moddates, seconds = moddates
+    summary = TimeFilter(rules, reftime)._summarize(moddates, start, seconds)
+    return summary, seconds
+
+
+def _bucketids(t, plan):
+    """Return tuple of the ids of the buckets populated by an item with
+    modification time `t` (older than the start of the current hour), given
+    the `(bounds, offset, n)` entries of a bucket plan (see
+    `TimeFilter._build_plan()`).
+    """
+    # The item is X hours/days/weeks/months/years old with X >= 1 if it is
+    # within the bounds. It may populate buckets in multiple categories. Stop
+    # at the first category whose oldest bucket is younger than the item.
+    bucketids = []
+    for bounds, offset, n in plan:
+        if t < bounds[0]:
+            break
+        p = bisect_right(bounds, t)
+        if p <= n:
+            bucketids.append(offset + p - 1)
+    return tuple(bucketids)
+
+
+def _merge_summaries(summaries, maxrecent):
+    """Combine summaries of disjoint sets of items, as returned by
+    `TimeFilter._summarize()`, into one.
+    """
+    winners = []
+    for candidates in zip(*(w for w, _ in summaries)):
+        candidates = [c for c in candidates if c is not None]
+        # (moddate, index) tuples: of two items with the same modification
+        # time the later one wins, as in `_summarize()`.
+        winners.append(max(candidates) if candidates else None)
+    recent = heapq.nlargest(maxrecent, chain(*(r for _, r in summaries)))
+    return winners, recent
+
+
+class _FutureItem(Exception):
+    """Raised for the item with index `index` and modification time `moddate`
+    later than the reference time.
+    """
+    def __init__(self, index, moddate):
+        Exception.__init__(self, index, moddate)
+        self.index = index
+        self.moddate = moddate
+
+
+# bytes.translate() table swapping 0 and 1.
+_INVERT = bytearray(range(256))
+_INVERT[0], _INVERT[1] = 1, 0
+_INVERT = bytes(_INVERT)
+
+
+def _future_error(obj, t, ref):
+    return TimeFilterError(("Cannot categorize %s: Modification time %s not "
+        "earlier than reference time %s.") % (obj, t, ref))
+
 
 class _TimedeltaError(TimeFilterError):
     pass
@@ -169,13 +799,16 @@ class _Timedelta(object):
     May 1, or 7:59 would be 1 hour earlier than 8:00. Differences are considered
     independently (e.g. 1 week usually isn't the same as 7 days) but may overlap
     (e.g. days may be 730, which will often mean that years == 2)
+
+    `refindices` may be provided as precomputed `timediff.indices(ref)`.
     """
-    def __init__(self, t, ref):
+    __slots__ = ("hours", "days", "weeks", "months", "years")
+
+    def __init__(self, t, ref, refindices=None):
         if t > ref:
             raise _TimedeltaError(("Modification time %s not " 
                 "earlier than reference time %s.") % (t, ref))
-        self.hours = timediff.hours(t, ref)
-        self.days = timediff.days(t, ref)
-        self.weeks = timediff.weeks(t, ref)
-        self.months = timediff.months(t, ref)
-        self.years = timediff.years(t, ref)
+        if refindices is None:
+            refindices = timediff.indices(ref)
+        (self.hours, self.days, self.weeks, self.months,
+            self.years) = timediff.diffs(t, refindices)
@@ -11,6 +11,7 @@ import stat
 import time
 import datetime
 import logging
+from . import localtime
 
 
 # Make the same code base run with Python 2 and 3.
@@ -37,7 +38,12 @@ class FilterItem(object):
     Public interface:
         self.text:    unicode object describing this item or None.
         self.moddate: last change as local datetime object.
+
+    Items use `__slots__` instead of a per-instance `__dict__`, since there may
+    be millions of them.
     """
+    __slots__ = ("text", "moddate")
+
     def __init__(self, moddate, text=None):
         if text is not None:
             assert isinstance(text, text_type)
@@ -59,39 +65,80 @@ class FilterItem(object):
 
 class FileSystemEntry(FilterItem):
     """Represents file system entry (for later filtering). Validates path upon
-    initialization, extracts information from inode, and stores inode data
-    for later usage. Public interface (in addition to FilterItem's interface):
+    initialization and extracts type and modification time from inode. If
+    both, `moddate` and `type` are provided, the file system is not accessed.
+    The same holds if the (lstat) stat result `statobj` is provided, for
+    instance from `os.scandir()`.
+    Public interface (in addition to FilterItem's interface):
         self.type: "dir", "file", or "symlink".
         self.path: path to file system entry.
+        self.modseconds: last change as local seconds (see `localtime`).
+
+    The inode modification time is converted to local seconds only. The
+    corresponding `moddate` datetime object is created upon first access, which
+    `TimeFilter.filter()` does not require.
     """
-    def __init__(self, path, moddate=None):
+    __slots__ = ("path", "type", "modseconds")
+
+    # Storage of the `moddate` property (the slot inherited from FilterItem).
+    _moddate = FilterItem.moddate
+
+    def __init__(self, path, moddate=None, type=None, statobj=None):
         log.debug("Creating FileSystemEntry from path %r.", path)
-        try:
-            # os.lstat(path)
-            # Perform the equivalent of an lstat() system call on the given
-            # path. Similar to stat(), but does not follow symbolic links.
-            # On platforms that do not support symbolic links, this is an alias
-            # for stat().
-            self._stat = os.lstat(path)
-        except OSError as e:
-            log.error("stat() failed on path: '%s' (%s).", path, e)
-            raise
-        self.type = self._get_type(self._stat)
-        log.debug("Detected type %s.", self.type)
-        if moddate is None:
-            # User may provide modification date -- if not, extract it from
-            # inode. This is a Unix timestamp, seconds since epoch. Not
-            # localized, convert to localized datetime
-            moddate = datetime.datetime.fromtimestamp(self._stat.st_mtime)
+        if type is not None and moddate is not None:
+            # Type and modification time are already known (e.g. from a
+            # previous run), don't touch the file system.
+            log.debug("Use known type %s and moddate %s.", type, moddate)
+            self.type = type
         else:
+            if statobj is None:
+                try:
+                    # os.lstat(path)
+                    # Perform the equivalent of an lstat() system call on the
+                    # given path. Similar to stat(), but does not follow
+                    # symbolic links. On platforms that do not support
+                    # symbolic links, this is an alias for stat().
+                    statobj = os.lstat(path)
+                except OSError as e:
+                    log.error("stat() failed on path: '%s' (%s).", path, e)
+                    raise
+            self.type = type if type is not None else self._get_type(statobj)
+            log.debug("Detected type %s.", self.type)
+            if moddate is None:
+                # User may provide modification date -- if not, extract it from
+                # inode. This is a Unix timestamp, seconds since epoch. Not
+                # localized, convert to local seconds.
+                self.path = path
+                self.text = self._decode(path)
+                self.modseconds = localtime.local_seconds(statobj.st_mtime)
+                return
             log.debug("Don't use stat mtime, use %s.", moddate)
         self.path = path
-        # FilterItem requires unicode `text` attribute, decode path if not
-        # already unicode:
-        t = path
-        if not isinstance(t, text_type):
-            t = t.decode(sys.getfilesystemencoding())
-        FilterItem.__init__(self, text=t, moddate=moddate)
+        # Sets `modseconds`, too.
+        FilterItem.__init__(self, text=self._decode(path), moddate=moddate)
+
+    @property
+    def moddate(self):
+        try:
+            return self._moddate
+        except AttributeError:
+            self._moddate = localtime.local_datetime(self.modseconds)
+            return self._moddate
+
+    @moddate.setter
+    def moddate(self, moddate):
+        # Keep `modseconds` consistent, it is what `TimeFilter.filter()` uses.
+        self._moddate = moddate
+        self.modseconds = localtime.seconds(moddate)
+
+    @staticmethod
+    def _decode(path):
+        """FilterItem requires unicode `text` attribute, decode path if not
+        already unicode.
+        """
+        if not isinstance(path, text_type):
+            return path.decode(sys.getfilesystemencoding())
+        return path
 
     def _get_type(self, statobj):
         """Determine file type from stat object `statobj`.
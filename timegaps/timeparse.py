@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+# Copyright 2014 Jan-Philip Gehrcke. See LICENSE file for details.
+
+
+"""timegaps.timeparse -- fast parsing of time strings with strptime() formats.
+"""
+
+
+import re
+import logging
+from datetime import datetime
+
+
+log = logging.getLogger("timeparse")
+
+
+# Patterns of the locale-independent strptime() directives, as used by
+# CPython's `_strptime` module. Other directives (month and weekday names,
+# AM/PM, time zones, week numbers, day of the year, ...) are left to
+# strptime().
+_PATTERNS = {
+    "d": r"(?P<d>3[0-1]|[1-2]\d|0[1-9]|[1-9]| [1-9])",
+    "f": r"(?P<f>[0-9]{1,6})",
+    "H": r"(?P<H>2[0-3]|[0-1]\d|\d)",
+    "m": r"(?P<m>1[0-2]|0[1-9]|[1-9])",
+    "M": r"(?P<M>[0-5]\d|\d)",
+    "S": r"(?P<S>6[0-1]|[0-5]\d|\d)",
+    "y": r"(?P<y>\d\d)",
+    "Y": r"(?P<Y>\d\d\d\d)",
+    }
+
+
+def _year2(s):
+    # POSIX: values 69-99 refer to the 20th century, 00-68 to the 21st.
+    y = int(s)
+    return y + 2000 if y <= 68 else y + 1900
+
+
+def _microsecond(s):
+    return int(s + "0" * (6 - len(s)))
+
+
+# Position in the datetime() argument list and conversion function of the
+# value of each directive.
+_FIELDS = {
+    "Y": (0, int),
+    "y": (0, _year2),
+    "m": (1, int),
+    "d": (2, int),
+    "H": (3, int),
+    "M": (4, int),
+    "S": (5, int),
+    "f": (6, _microsecond),
+    }
+
+
+class TimeParser(object):
+    """Parse time strings according to strptime() format string `fmt`, with
+    the same result as `datetime.strptime(s, fmt)`.
+
+    `fmt` is compiled once into a single regular expression, built from the
+    same directive patterns as used by strptime(). Each string is parsed by
+    one regex match and one int conversion per directive, which avoids the
+    locale lock, the regex cache lookup and the generic directive handling of
+    strptime(). Formats with locale-dependent or other unsupported
+    directives are handled by strptime(). Strings that do not match (or
+    that represent an invalid date) are passed to strptime() as well, so
+    that errors are reported in exactly the same way.
+    """
+    def __init__(self, fmt):
+        self.fmt = fmt
+        self._regex = None
+        try:
+            self._regex, self._fields = self._compile(fmt)
+        except (KeyError, IndexError, re.error):
+            log.debug("Use strptime() for format %r.", fmt)
+            return
+        # Common case, e.g. '%Y%m%d-%H%M%S': the regex groups are the leading
+        # datetime() arguments (at least year, month and day), in order, and
+        # all of them are plain integers.
+        self._direct = len(self._fields) >= 3 and self._fields == [
+            (pos, int) for pos in range(len(self._fields))]
+
+    @staticmethod
+    def _compile(fmt):
+        """Return compiled regex and list of (argument position, conversion
+        function) tuples, one per regex group. Raise `KeyError` for
+        unsupported directives, `IndexError` for a stray '%' and `re.error`
+        for directives that occur more than once.
+        """
+        # Escape characters and replace whitespace like strptime() does.
+        fmt = re.sub(r"([\\.^$*+?\(\){}\[\]|])", r"\\\1", fmt)
+        fmt = re.sub(r"\s+", r"\\s+", fmt)
+        pattern = []
+        fields = []
+        while "%" in fmt:
+            i = fmt.index("%")
+            directive = fmt[i + 1]
+            pattern.append(fmt[:i])
+            if directive == "%":
+                pattern.append("%")
+            else:
+                pattern.append(_PATTERNS[directive])
+                fields.append(_FIELDS[directive])
+            fmt = fmt[i + 2:]
+        pattern.append(fmt)
+        return re.compile("".join(pattern), re.IGNORECASE), fields
+
+    def parse(self, s):
+        """Return naive datetime object parsed from string `s`. Raise
+        `ValueError` if `s` does not match the format.
+        """
+        if self._regex is None:
+            return datetime.strptime(s, self.fmt)
+        m = self._regex.match(s)
+        if m is None or m.end() != len(s):
+            return datetime.strptime(s, self.fmt)
+        try:
+            if self._direct:
+                return datetime(*map(int, m.groups()))
+            args = [1900, 1, 1, 0, 0, 0, 0]
+            for (pos, convert), value in zip(self._fields, m.groups()):
+                args[pos] = convert(value)
+            return datetime(*args)
+        except ValueError:
+            return datetime.strptime(s, self.fmt)
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+# Copyright 2014 Jan-Philip Gehrcke. See LICENSE file for details.
+
+"""Measure the memory consumption per item of FilterItem and FileSystemEntry
+objects, compared to equivalent objects carrying a per-instance `__dict__`
+(and, for FileSystemEntry, the full stat result), which is how these classes
+were laid out before they used `__slots__`. FileSystemEntry objects are
+created both with a given modification time and from a stat result (as the
+timegaps command creates them, without a `moddate` datetime object).
+
+Requires Python 3.4+ (tracemalloc). Usage:
+
+$ python utils/bench_memory.py [N]
+"""
+
+import os
+import sys
+import stat
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from timegaps.timegaps import FileSystemEntry, FilterItem
+
+
+# Standalone copies of the classes as they were laid out before they used
+# `__slots__` (subclasses of the current classes would keep the attributes
+# in the inherited slots).
+
+
+class DictFilterItem(object):
+    """FilterItem with per-instance `__dict__` (no `__slots__`)."""
+    def __init__(self, moddate, text=None):
+        self.text = text
+        self.moddate = moddate
+
+
+class DictFileSystemEntry(DictFilterItem):
+    """FileSystemEntry with per-instance `__dict__`, keeping the stat result.
+    """
+    def __init__(self, path, moddate=None):
+        self._stat = os.lstat(path)
+        if stat.S_ISREG(self._stat.st_mode):
+            self.type = "file"
+        elif stat.S_ISDIR(self._stat.st_mode):
+            self.type = "dir"
+        else:
+            self.type = "symlink"
+        if moddate is None:
+            moddate = datetime.fromtimestamp(self._stat.st_mtime)
+        self.path = path
+        DictFilterItem.__init__(self, text=path, moddate=moddate)
+
+
+def bytes_per_item(factory, n):
+    """Return the number of bytes allocated per object created by
+    `factory(i)` for i in range(n), excluding the list holding them.
+    """
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objs = [None] * n
+    listsize = tracemalloc.get_traced_memory()[0] - before
+    for i in range(n):
+        objs[i] = factory(i)
+    total = tracemalloc.get_traced_memory()[0] - before - listsize
+    tracemalloc.stop()
+    return total / float(n)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10**5
+    ref = datetime.now()
+    # Share the same datetime and text objects between both variants, so that
+    # the difference is solely due to the object layout.
+    moddates = [ref - timedelta(seconds=i) for i in range(n)]
+    texts = ["item-%07d" % i for i in range(n)]
+    results = []
+
+    for cls in (DictFilterItem, FilterItem):
+        b = bytes_per_item(lambda i: cls(moddate=moddates[i], text=texts[i]), n)
+        results.append((cls.__name__, b))
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        paths = []
+        for i in range(min(n, 1000)):
+            p = os.path.join(tmpdir, "f%04d" % i)
+            open(p, "w").close()
+            paths.append(p)
+        m = len(paths)
+        for cls in (DictFileSystemEntry, FileSystemEntry):
+            b = bytes_per_item(lambda i: cls(paths[i % m], moddates[i]), n)
+            results.append((cls.__name__, b))
+        # Entries created from a stat result, like the CLI creates them:
+        # the modification time is kept as local seconds, `moddate` is not
+        # created until accessed.
+        b = bytes_per_item(lambda i: DictFileSystemEntry(paths[i % m]), n)
+        results.append(("DictFileSystemEntry (from stat)", b))
+        b = bytes_per_item(lambda i: FileSystemEntry(paths[i % m]), n)
+        results.append(("FileSystemEntry (from stat)", b))
+        statobjs = [os.lstat(p) for p in paths]
+        b = bytes_per_item(
+            lambda i: FileSystemEntry(paths[i % m], statobj=statobjs[i % m]), n)
+        results.append(("FileSystemEntry (from --scan stat result)", b))
+    finally:
+        for p in paths:
+            os.remove(p)
+        os.rmdir(tmpdir)
+
+    print("Memory per item (N = %s; moddate and text/path objects shared, "
+        "text of FileSystemEntry is the path itself):" % n)
+    for name, b in results:
+        print("  %-42s %7.1f bytes" % (name, b))
+
+
+if __name__ == "__main__":
+    main()
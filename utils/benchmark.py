@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+# Copyright 2014 Jan-Philip Gehrcke. See LICENSE file for details.
+
+"""Benchmark suite: measure the run time of TimeFilter.filter() (for several
+rule shapes), the timediff functions, FileSystemEntry construction, rules and
+time string parsing, stdin splitting and stdout writing for increasing numbers
+of items. Write the results to a JSON file and/or compare them against the
+results of a previous run (the baseline), e.g. before a release:
+
+$ python utils/benchmark.py -o baseline.json
+  ... change code ...
+$ python utils/benchmark.py --baseline baseline.json
+
+Exit with code 1 if any benchmark is slower than in the baseline by more than
+the --threshold factor. Results are only comparable when measured on the same
+machine with the same Python version.
+
+The reference baseline, measured with the default options, is stored in
+utils/benchmark-baseline.json (see its "python" and "platform" entries).
+Compare against it with:
+
+$ python utils/benchmark.py --baseline utils/benchmark-baseline.json
+
+After an intended performance change, or to move the reference to another
+machine or Python version, regenerate it with the default options and commit
+the result:
+
+$ python utils/benchmark.py -o utils/benchmark-baseline.json
+
+Sizes are given as powers of ten (default: 3-5, up to 7 is supported). Note
+that 10^7 items require a few GB of memory. FileSystemEntry construction uses
+at most --max-files distinct files (created in a temporary directory), which
+are stat()ed repeatedly for larger sizes.
+"""
+
+from __future__ import print_function, unicode_literals
+import io
+import os
+import sys
+import json
+import shutil
+import argparse
+import platform
+import tempfile
+import time
+from datetime import datetime, timedelta
+from random import Random
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from timegaps import timediff
+from timegaps import main as timegaps_main
+from timegaps.timegaps import FileSystemEntry, FilterItem
+from timegaps.timefilter import TimeFilter
+
+
+# time.perf_counter() is not available on Python 2.
+timer = getattr(time, "perf_counter", time.time)
+
+
+REFTIME = datetime(2016, 12, 31, 23, 59, 59)
+# Items are spread over this many seconds before the reference time.
+SPAN = 10 * 365 * 24 * 60 * 60
+
+
+RULE_SHAPES = {
+    "recent": "recent10",
+    "days": "days30",
+    "typical": "recent5,hours48,days30,weeks8,months12,years8",
+    "wide": "recent50,hours720,days365,weeks200,months120,years50",
+    }
+
+
+def moddates(n, seed=0):
+    """Return list of `n` pseudo-random datetime objects within `SPAN`."""
+    r = Random(seed)
+    return [REFTIME - timedelta(seconds=r.randint(0, SPAN)) for _ in range(n)]
+
+
+def bench_filter(n, shape):
+    items = [FilterItem(moddate=d) for d in moddates(n)]
+    rules = timegaps_main.parse_rules_from_cmdline(RULE_SHAPES[shape])
+    f = TimeFilter(rules, REFTIME)
+    return lambda: f.filter(items)
+
+
+def bench_timediff(n, func):
+    pairs = list(zip(moddates(n, seed=1), moddates(n, seed=2)))
+    if func == "indices":
+        dates = [t1 for t1, _ in pairs]
+        return lambda: [timediff.indices(t) for t in dates]
+    func = getattr(timediff, func)
+    return lambda: [func(t1, t2) for t1, t2 in pairs]
+
+
+def bench_fse(n, tmpdir, max_files):
+    paths = []
+    for i in range(min(n, max_files)):
+        p = os.path.join(tmpdir, "f%07d" % i)
+        if not os.path.exists(p):
+            open(p, "w").close()
+        paths.append(p)
+    m = len(paths)
+    return lambda: [FileSystemEntry(paths[i % m]) for i in range(n)]
+
+
+def bench_rules(n):
+    # Rules strings are short; parse `n` of them.
+    strings = list(RULE_SHAPES.values())
+    strings = [strings[i % len(strings)] for i in range(n)]
+    return lambda: [timegaps_main.parse_rules_from_cmdline(s) for s in strings]
+
+
+def bench_parse_time(n):
+    fmt = "%Y%m%d-%H%M%S"
+    strings = [d.strftime(fmt) for d in moddates(n)]
+    return lambda: [timegaps_main.local_datetime_from_localtime_string(s, fmt)
+        for s in strings]
+
+
+def bench_stdin(n, nullsep):
+    sep = b"\0" if nullsep else b"\n"
+    data = sep.join(("/some/directory/item-%07d" % i).encode("ascii")
+        for i in range(n)) + sep
+
+    def run():
+        timegaps_main.stdin_read_bytes = io.BytesIO(data).read
+        # Do not depend on sys.stdout.encoding, which is None on Python 2
+        # when stdout is not a terminal.
+        return timegaps_main.read_items_from_stdin("utf-8")
+
+    # `read_items_from_stdin()` reads options from the module namespace.
+    timegaps_main.options = argparse.Namespace(nullsep=nullsep)
+    return run
+
+
+def bench_stdout(n, nullsep):
+    items = [FilterItem(moddate=REFTIME, text="/some/directory/item-%07d" % i)
+        for i in range(n)]
+    sep = "\0" if nullsep else "\n"
+    # `write_items()` updates the stats of the module namespace.
+    timegaps_main.stats = timegaps_main.Stats()
+
+    def run():
+        timegaps_main.stdout_write_bytes = io.BytesIO().write
+        timegaps_main.write_items(items, "utf-8", sep)
+
+    return run
+
+
+def benchmarks(sizes, tmpdir, max_files):
+    """Yield (name, size, setup) tuples. `setup()` returns the function to be
+    timed.
+    """
+    for n in sizes:
+        for shape in sorted(RULE_SHAPES):
+            yield "filter[%s]" % shape, n, lambda n=n, s=shape: bench_filter(n, s)
+        for func in ("hours", "days", "weeks", "months", "years", "indices"):
+            yield "timediff.%s" % func, n, lambda n=n, f=func: bench_timediff(n, f)
+        yield "FileSystemEntry", n, lambda n=n: bench_fse(n, tmpdir, max_files)
+        yield "parse_rules", n, lambda n=n: bench_rules(n)
+        yield "parse_time", n, lambda n=n: bench_parse_time(n)
+        for nullsep in (False, True):
+            name = "stdin[%s]" % ("nul" if nullsep else "newline")
+            yield name, n, lambda n=n, s=nullsep: bench_stdin(n, s)
+            name = "stdout[%s]" % ("nul" if nullsep else "newline")
+            yield name, n, lambda n=n, s=nullsep: bench_stdout(n, s)
+
+
+def measure(func, repeat):
+    """Return the shortest of `repeat` run times of `func()` in seconds."""
+    durations = []
+    for _ in range(repeat):
+        t0 = timer()
+        func()
+        durations.append(timer() - t0)
+    return min(durations)
+
+
+def compare(results, baseline, threshold):
+    """Print comparison of `results` with `baseline` results. Return list of
+    keys of benchmarks slower by more than factor `threshold`.
+    """
+    regressions = []
+    print("\n%-28s %10s %10s %7s" % ("benchmark", "baseline", "current", "ratio"))
+    for key in sorted(results, key=_sortkey):
+        if key not in baseline:
+            continue
+        old = baseline[key]["seconds"]
+        new = results[key]["seconds"]
+        ratio = new / old if old > 0 else float("inf")
+        flag = ""
+        if ratio > threshold:
+            regressions.append(key)
+            flag = "  REGRESSION"
+        print("%-28s %10.4f %10.4f %7.2f%s" % (key, old, new, ratio, flag))
+    return regressions
+
+
+def _sortkey(key):
+    name, size = key.rsplit("/", 1)
+    return name, int(size)
+
+
+def parse_sizes(s):
+    """Parse '3-5' or '3,5,7' into list of powers of ten."""
+    if "-" in s:
+        lo, hi = s.split("-")
+        exps = range(int(lo), int(hi) + 1)
+    else:
+        exps = [int(e) for e in s.split(",")]
+    return [10**e for e in exps]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-s", "--sizes", default="3-5",
+        help="Powers of ten, e.g. '3-7' or '3,5' (default: 3-5).")
+    parser.add_argument("-r", "--repeat", type=int, default=3,
+        help="Report the best of REPEAT runs (default: 3).")
+    parser.add_argument("-k", "--select", default=None,
+        help="Only run benchmarks whose name contains this string.")
+    parser.add_argument("--max-files", type=int, default=10**4,
+        help="Maximum number of files created for FileSystemEntry "
+            "construction (default: 10000).")
+    parser.add_argument("-o", "--output", metavar="FILE",
+        help="Write results to JSON file FILE.")
+    parser.add_argument("-b", "--baseline", metavar="FILE",
+        help="Compare results with JSON file FILE of a previous run.")
+    parser.add_argument("-t", "--threshold", type=float, default=1.25,
+        help="Maximum tolerated slowdown factor compared to the baseline "
+            "(default: 1.25).")
+    args = parser.parse_args()
+
+    results = {}
+    tmpdir = tempfile.mkdtemp(prefix="timegaps-benchmark-")
+    try:
+        for name, n, setup in benchmarks(
+                parse_sizes(args.sizes), tmpdir, args.max_files):
+            if args.select and args.select not in name:
+                continue
+            seconds = measure(setup(), args.repeat)
+            key = "%s/%s" % (name, n)
+            results[key] = {"size": n, "seconds": seconds,
+                "ns_per_item": 10**9 * seconds / n}
+            print("%-28s %10.4f s %10.1f ns/item" % (
+                key, seconds, results[key]["ns_per_item"]))
+            sys.stdout.flush()
+    finally:
+        shutil.rmtree(tmpdir)
+
+    doc = {
+        "created": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "results": results,
+        }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(doc, f, indent=1, sort_keys=True)
+        print("Results written to %s." % args.output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["python"] != doc["python"]:
+            print("Warning: baseline measured with Python %s." %
+                baseline["python"])
+        regressions = compare(results, baseline["results"], args.threshold)
+        if regressions:
+            print("\n%s benchmark(s) slower than baseline by more than factor "
+                "%.2f." % (len(regressions), args.threshold))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()